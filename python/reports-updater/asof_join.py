@@ -0,0 +1,62 @@
+"""
+"As-of" lookups of RF2 refset rows.
+For every event (e.g. a concept inactivation) pick the latest refset row with the
+same key whose effectiveTime is at or before the event, without building the
+events x rows cross product.
+"""
+import numpy as np
+import pandas as pd
+
+
+def asof_join(events: pd.DataFrame,
+              rows: pd.DataFrame,
+              on: str,
+              by,
+              row_time: str = "effectiveTime",
+              columns=None) -> pd.DataFrame:
+    """
+    Attaches to each event the latest row of `rows` with the same `by` key and
+    rows[row_time] <= events[on].
+
+    Parameters
+    ----------
+    events : DataFrame
+        One row per event; must contain the `by` column(s) and the `on` time column.
+    rows : DataFrame
+        RF2 rows (any order) with the `by` column(s) and `row_time`.
+    on : str
+        Event time column, e.g. 'inactivationEffectiveTime'. Must have the same
+        dtype as rows[row_time].
+    by : str or list[str]
+        Key column(s) that must match exactly, e.g. 'conceptId'.
+    row_time : str
+        Time column of `rows`; it is added to the result as the matched row's time.
+    columns : list[str], optional
+        Columns of `rows` to attach. Defaults to every non-key column.
+
+    Returns the events in their original order with the attached columns, which
+    are missing (NaN/NA) where no row qualifies. When several rows share the
+    matching effectiveTime, the last one in `rows` order wins.
+    """
+    by_cols = [by] if isinstance(by, str) else list(by)
+    if columns is None:
+        columns = [c for c in rows.columns if c not in by_cols and c != row_time]
+
+    # merge_asof needs both sides sorted on the time key; a stable sort keeps
+    # the original row order among equal times.
+    right = rows[by_cols + [row_time] + list(columns)].sort_values(row_time, kind="stable")
+    left = events.assign(_event_order=np.arange(len(events)))
+    left = left.sort_values(on, kind="stable")
+
+    if on == row_time:
+        merged = pd.merge_asof(left, right, on=on, by=by_cols, direction="backward")
+    else:
+        merged = pd.merge_asof(
+            left, right,
+            left_on=on, right_on=row_time,
+            by=by_cols,
+            direction="backward"
+        )
+
+    merged = merged.sort_values("_event_order", kind="stable")
+    return merged.drop(columns="_event_order").reset_index(drop=True)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the parallel (multi-connection) release download of
+download_and_extract.download_snomed against a local HTTP server that serves
+byte ranges and limits the throughput of each connection, like a distant
+server whose single TCP stream stays below the capacity of the link.
+
+    python3 benchmark_download.py [--size-mb 128] [--rate-mb 8] [--connections 1 2 4 8]
+
+Every download is checked against the SHA-256 of the served file. The last
+row downloads from the same server with Range support turned off, which
+falls back to a single stream.
+"""
+import argparse
+import hashlib
+import io
+import os
+import threading
+import time
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+
+os.environ.setdefault("SNOMED_USER", "test")
+os.environ.setdefault("SNOMED_PASSWORD", "test")
+os.environ.setdefault("CI", "true")  # no progress bars between the results
+
+from download_and_extract import download_snomed
+
+BLOCK_SIZE = 64 * 1024
+
+
+class ThrottledRangeHandler(BaseHTTPRequestHandler):
+    """Serves payload, honouring Range requests if supports_range, at rate bytes/s per connection."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    payload = b""
+    rate = 0
+    supports_range = True
+    requests_seen = 0
+
+    def do_GET(self):
+        ThrottledRangeHandler.requests_seen += 1
+        size = len(self.payload)
+        start, end = 0, size
+        range_header = self.headers.get("Range")
+        if range_header and self.supports_range:
+            first, last = range_header.split("=")[1].split("-")
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes" if self.supports_range else "none")
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+
+        sent_at = time.perf_counter()
+        try:
+            for offset in range(start, end, BLOCK_SIZE):
+                block = self.payload[offset:min(offset + BLOCK_SIZE, end)]
+                self.wfile.write(block)
+                sent_at += len(block) / self.rate
+                time.sleep(max(0, sent_at - time.perf_counter()))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client only wanted the headers (a Range probe answered with 200)
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def run(url, payload_sha256, connections):
+    with TemporaryDirectory() as output_dir:
+        started = time.perf_counter()
+        # Keep the download log out of the results table
+        with redirect_stdout(io.StringIO()):
+            zip_path = download_snomed(url, output_dir, expected_sha256=payload_sha256, connections=connections)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(zip_path)
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=128, help="size of the served file (MB)")
+    parser.add_argument("--rate-mb", type=float, default=8, help="throughput of one connection (MB/s)")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    ThrottledRangeHandler.payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    ThrottledRangeHandler.rate = args.rate_mb * 1024 * 1024
+    payload_sha256 = hashlib.sha256(ThrottledRangeHandler.payload).hexdigest()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottledRangeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/release.zip"
+
+    print("=" * 70)
+    print(f"⏱  Download benchmark: {args.size_mb:.0f} MB at {args.rate_mb:.0f} MB/s per connection")
+    print("=" * 70)
+    print(f"{'Connections':>12} {'Requests':>9} {'Seconds':>8} {'MB/s':>7} {'Speedup':>8}")
+    baseline = None
+    runs = [(connections, True) for connections in args.connections] + [(max(args.connections), False)]
+    for connections, supports_range in runs:
+        ThrottledRangeHandler.supports_range = supports_range
+        ThrottledRangeHandler.requests_seen = 0
+        elapsed, size = run(url, payload_sha256, connections)
+        baseline = baseline or elapsed
+        label = str(connections) if supports_range else f"{connections} (no Range)"
+        print(f"{label:>12} {ThrottledRangeHandler.requests_seen:>9} {elapsed:>8.2f} "
+              f"{size / (1024*1024) / elapsed:>7.1f} {baseline / elapsed:>7.1f}x")
+    server.shutdown()
+    print("=" * 70)
+    print("✅ All downloads matched the SHA-256 of the served file")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,15 @@ def log(message, verbose=True):
     if verbose or not is_ci():
         print(message)
 
+def set_output(name, value):
+    """
+    Set a step output of the current GitHub Actions step (no-op elsewhere).
+    """
+    output_path = os.getenv('GITHUB_OUTPUT')
+    if output_path:
+        with open(output_path, 'a', encoding='utf-8') as f:
+            f.write(f"{name}={value}\n")
+
 def convert_numpy_types(obj):
     """
     Recursively convert NumPy types to native Python types for JSON serialization.
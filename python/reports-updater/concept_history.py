@@ -0,0 +1,101 @@
+"""
+Single-pass concept history engine.
+Scans the Full concept table once and emits one row of per-concept facts
+(creation, first inactivation, reactivations, definitionStatus and module
+changes) that the new-concept and inactivation reports both read from.
+"""
+import numpy as np
+import pandas as pd
+from rf2_loader import load_rf2
+
+# Rows stamped with the first RF2 release are not treated as creations
+INITIAL_RELEASE_TIME = 20020131
+
+_NO_TIME = np.iinfo(np.int32).max
+
+
+def _changed(values):
+    changed = np.zeros(len(values), dtype=bool)
+    changed[1:] = values[1:] != values[:-1]
+    return changed
+
+
+def build_concept_history(concept_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds per-concept facts from a Full concept table (any row order) with
+    the columns id, effectiveTime, active, moduleId and definitionStatusId.
+
+    Returns one row per concept, sorted by conceptId:
+      - conceptId
+      - firstActiveTime: earliest effectiveTime with active == 1
+      - creationEffectiveTime: as firstActiveTime, ignoring rows stamped
+        INITIAL_RELEASE_TIME (what the new concepts report counts)
+      - firstInactivationTime: first active -> inactive transition
+      - reactivationCount: inactive -> active transitions
+      - definitionStatusChangeCount, moduleChangeCount: changes between
+        consecutive rows
+      - active, moduleId, definitionStatusId: values of the latest row
+    Times are nullable Int32 (missing when the event never happened).
+    """
+    ids = concept_df['id'].to_numpy()
+    times = concept_df['effectiveTime'].to_numpy()
+    order = np.lexsort((times, ids))
+
+    ids = ids[order]
+    times = times[order]
+    active = concept_df['active'].to_numpy()[order]
+    module = concept_df['moduleId'].to_numpy()[order]
+    definition_status = concept_df['definitionStatusId'].to_numpy()[order]
+
+    # Row i continues the history of row i-1 unless the id changes there
+    same_concept = np.zeros(len(ids), dtype=bool)
+    same_concept[1:] = ids[1:] == ids[:-1]
+    last_of_concept = np.ones(len(ids), dtype=bool)
+    last_of_concept[:-1] = ~same_concept[1:]
+    starts = np.flatnonzero(~same_concept)
+    ends = np.flatnonzero(last_of_concept)
+
+    prev_active = np.zeros(len(active), dtype=active.dtype)
+    prev_active[1:] = active[:-1]
+    is_active = active == 1
+    inactivated = same_concept & ~is_active & (prev_active == 1)
+    reactivated = same_concept & is_active & (prev_active == 0)
+    module_changed = same_concept & _changed(module)
+    definition_changed = same_concept & _changed(definition_status)
+
+    def first_time(mask):
+        if not len(starts):
+            return pd.array([], dtype='Int32')
+        first = np.minimum.reduceat(np.where(mask, times, _NO_TIME), starts)
+        return pd.arrays.IntegerArray(first.astype(np.int32), first == _NO_TIME)
+
+    def count(mask):
+        if not len(starts):
+            return np.zeros(0, dtype=np.int32)
+        return np.add.reduceat(mask.astype(np.int32), starts)
+
+    return pd.DataFrame({
+        'conceptId': ids[starts],
+        'firstActiveTime': first_time(is_active),
+        'creationEffectiveTime': first_time(is_active & (times != INITIAL_RELEASE_TIME)),
+        'firstInactivationTime': first_time(inactivated),
+        'reactivationCount': count(reactivated),
+        'definitionStatusChangeCount': count(definition_changed),
+        'moduleChangeCount': count(module_changed),
+        'active': active[ends],
+        'moduleId': module[ends],
+        'definitionStatusId': definition_status[ends],
+    })
+
+
+def load_concept_history(concept_full_path) -> pd.DataFrame:
+    """
+    Loads the Full concept file (path, ZipMember or cached table) and returns
+    build_concept_history() of it.
+    """
+    concept_df = load_rf2(
+        concept_full_path,
+        "concept",
+        columns=['id', 'effectiveTime', 'active', 'moduleId', 'definitionStatusId']
+    )
+    return build_concept_history(concept_df)
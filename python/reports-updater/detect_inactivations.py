@@ -1,130 +1,85 @@
 #!/usr/bin/env python3
 import pandas as pd
-import os
-from tqdm import tqdm
 from halo import Halo
-import multiprocessing
-from multiprocessing import Pool
 from ci_utils import is_ci
-
-def process_concept_group(args):
-    """Process a single concept group to detect inactivations."""
-    concept_id, group = args
-    group = group[['id', 'effectiveTime', 'active']].copy()
-    group['prev_active'] = group['active'].shift(1)
-    inactivated_rows = group[(group['active'] == 0) & (group['prev_active'] == 1)]
-
-    if not inactivated_rows.empty:
-        first_inactivate_row = inactivated_rows.iloc[0]
-        return {
-            'conceptId': concept_id,
-            'inactivationEffectiveTime': first_inactivate_row['effectiveTime']
-        }
-    return None
+from rf2_loader import load_rf2, rf2_exists
+from asof_join import asof_join
+from concept_history import load_concept_history
+from fsn_lookup import build_fsn_lookup
 
 def detect_inactivations(concept_full_path, 
                          description_snapshot_path, 
                          refset_inactivation_path,
                          refset_historical_associations_path,
-                         output_path):
+                         output_path=None,
+                         concept_history=None,
+                         fsn_lookup=None):
     """
     Detects inactivations from a SNOMED CT 'Full' concept file (RF2), merges them 
     with their inactivation reasons from the Concept Inactivation Indicator Reference Set,
-    and writes them out with conceptId, FSN, the effectiveTime when the concept was 
-    inactivated, and the inactivation reason to an Excel (.xlsx) file.
+    and returns them with conceptId, FSN, the effectiveTime when the concept was 
+    inactivated, and the inactivation reason as a DataFrame. If output_path is
+    given, the result is also written to an Excel (.xlsx) file.
+
+    concept_history can be the output of concept_history.load_concept_history
+    when it is shared with other reports; the Full concept file is then not read.
+    Likewise fsn_lookup can be a shared fsn_lookup.FSNLookup; otherwise it is
+    built from the Snapshot description file.
     """
     if not is_ci():
         print("Detecting inactivations...")
     spinner = Halo(text='Starting inactivation detection process...', spinner='dots', enabled=not is_ci())
 
     # Check if files exist
-    if not os.path.exists(concept_full_path):
+    if concept_history is None and not rf2_exists(concept_full_path):
         raise FileNotFoundError(f"Concept file not found: {concept_full_path}")
-    if not os.path.exists(description_snapshot_path):
+    if fsn_lookup is None and not rf2_exists(description_snapshot_path):
         raise FileNotFoundError(f"Description file not found: {description_snapshot_path}")
-    if not os.path.exists(refset_inactivation_path):
+    if not rf2_exists(refset_inactivation_path):
         raise FileNotFoundError(f"Inactivation reference set file not found: {refset_inactivation_path}")
 
     # ----------------------------------------------------------------------
-    # 1. Load Full concept file into a pandas DataFrame
+    # 1. Concept history from the Full concept file
     # ----------------------------------------------------------------------
-    spinner.start("Loading Full concept file...")
-    concept_df = pd.read_csv(
-        concept_full_path,
-        sep='\t',
-        dtype=str,
-        on_bad_lines='skip'
-    )
-    concept_df['active'] = concept_df['active'].astype(int, errors='ignore')
-    concept_df.sort_values(by=['id', 'effectiveTime'], inplace=True)
-    spinner.succeed("Loaded and sorted Full concept file.")
+    if concept_history is None:
+        spinner.start("Loading Full concept file and building concept history...")
+        concept_history = load_concept_history(concept_full_path)
+        spinner.succeed("Concept history built.")
 
     # ----------------------------------------------------------------------
-    # 2. Detect inactivations (single-process)
+    # 2. First active -> inactive transition per concept
     # ----------------------------------------------------------------------
-    spinner.start("Grouping concepts for inactivation detection...")
-    grouped_concepts = list(concept_df.groupby('id'))
-    spinner.succeed("Concepts grouped.")
-
-    # Convert grouped DataFrame objects to argument tuples
-    arg_list = [(concept_id, group) for concept_id, group in grouped_concepts]
-
-    results = []
-    with Pool(processes=multiprocessing.cpu_count()) as pool:
-        # pool.imap(...) returns an iterator lazily
-        # We'll wrap that in tqdm so we get a progress bar (disabled in CI)
-        for res in tqdm(pool.imap(process_concept_group, arg_list),
-                        total=len(arg_list),
-                        desc="Processing concepts in parallel",
-                        disable=is_ci()):
-            if res is not None:
-                results.append(res)
-
-    # Convert to DataFrame
-    inactivation_df = pd.DataFrame(results)
+    inactivation_df = concept_history.loc[
+        concept_history['firstInactivationTime'].notna(),
+        ['conceptId', 'firstInactivationTime']
+    ].rename(columns={'firstInactivationTime': 'inactivationEffectiveTime'})
+    inactivation_df = inactivation_df.astype({'inactivationEffectiveTime': 'int32'})
+    spinner.succeed(f"Detected {len(inactivation_df)} inactivated concepts.")
 
     # ----------------------------------------------------------------------
-    # 3. Load the Snapshot description file and extract FSNs
+    # 3. FSN lookup from the Snapshot description file
     # ----------------------------------------------------------------------
-    spinner.start("Loading Snapshot description file...")
-    desc_df = pd.read_csv(
-        description_snapshot_path,
-        sep='\t',
-        dtype=str,
-        on_bad_lines='skip',
-        quoting=3
-    )
-    # FSN filter
-    fsn_df = desc_df[
-        (desc_df['typeId'] == '900000000000003001') & 
-        (desc_df['active'] == '1')
-    ][['conceptId', 'term']].drop_duplicates()
-    fsn_df.rename(columns={'term': 'FSN'}, inplace=True)
-    spinner.succeed("Snapshot description file loaded (FSNs extracted).")
+    if fsn_lookup is None:
+        spinner.start("Loading Snapshot description file...")
+        fsn_lookup = build_fsn_lookup(description_snapshot_path)
+        spinner.succeed("Snapshot description file loaded (FSNs extracted).")
 
     # ----------------------------------------------------------------------
-    # 4. Merge the inactivation info with the FSN
+    # 4. Attach the concept FSN
     # ----------------------------------------------------------------------
-    spinner.start("Merging inactivation data with concept FSNs...")
-    final_df = pd.merge(
-        inactivation_df, fsn_df,
-        how='left',
-        on='conceptId'
-    )
-    spinner.succeed("Inactivation data merged with concept FSNs.")
+    final_df = inactivation_df.assign(FSN=fsn_lookup.terms(inactivation_df['conceptId']))
 
     # ----------------------------------------------------------------------
     # 5. Load the Concept Inactivation Indicator Reference Set
     # ----------------------------------------------------------------------
     spinner.start("Loading Inactivation Indicator Reference Set...")
-    reason_df = pd.read_csv(
+    reason_df = load_rf2(
         refset_inactivation_path,
-        sep='\t',
-        dtype=str,
-        on_bad_lines='skip'
+        "refset_inactivation",
+        columns=['effectiveTime', 'refsetId', 'referencedComponentId', 'valueId']
     )
     # Only rows from the refset '900000000000489007'
-    reason_df = reason_df[reason_df['refsetId'] == '900000000000489007'].copy()
+    reason_df = reason_df[reason_df['refsetId'] == 900000000000489007].copy()
 
     # Rename to keep things clear
     reason_df.rename(
@@ -134,106 +89,58 @@ def detect_inactivations(concept_full_path,
         },
         inplace=True
     )
+    # Nullable ints keep 18-digit SCTIDs exact through the left joins below
+    reason_df['inactivationReasonId'] = reason_df['inactivationReasonId'].astype('Int64')
     spinner.succeed("Inactivation Indicator Reference Set loaded.")
 
     # ----------------------------------------------------------------------
     # 6. Merge inactivation records with inactivation reason
     # ----------------------------------------------------------------------
-    spinner.start("Deriving correct reason row (<= inactivation date) without merge_asof...")
+    spinner.start("Deriving correct reason row (<= inactivation date)...")
 
-    final_df['inactivationEffectiveTime'] = final_df['inactivationEffectiveTime'].astype(int)
-    reason_df['effectiveTime'] = reason_df['effectiveTime'].astype(int)
-    final_df['conceptId'] = final_df['conceptId'].astype(int)
-    reason_df['conceptId'] = reason_df['conceptId'].astype(int)
-
-    final_df.sort_values(by=['conceptId','inactivationEffectiveTime'], inplace=True)
-    reason_df.sort_values(by=['conceptId','effectiveTime'], inplace=True)
-
-    merged_all = pd.merge(
+    # Latest reason row with effectiveTime <= inactivation date, per concept
+    merged_df = asof_join(
         final_df,
         reason_df[['conceptId', 'effectiveTime', 'inactivationReasonId']],
-        on='conceptId',
-        how='left'
-    )
-
-    merged_all = merged_all[
-        merged_all['effectiveTime'].isna() |
-        (merged_all['effectiveTime'] <= merged_all['inactivationEffectiveTime'])
-    ]
-
-    merged_all.sort_values(
-        by=['conceptId','inactivationEffectiveTime','effectiveTime'],
-        inplace=True
+        on='inactivationEffectiveTime',
+        by='conceptId'
     )
 
-    grouped = merged_all.groupby(
-        ['conceptId', 'inactivationEffectiveTime'],
-        as_index=False,
-        sort=False
-    ).last()  # 'last' picks largest effectiveTime <= inactivation date
-    merged_df = grouped.copy()
-
     spinner.succeed("Selected the valid inactivation reason rows (<= inactivation date).")
 
     # Fill in missing reason
-    merged_df['inactivationReasonId'] = merged_df['inactivationReasonId'].fillna('0')
-    merged_df['inactivationReasonFSN'] = 'Not specified'
+    merged_df['inactivationReasonId'] = merged_df['inactivationReasonId'].fillna(0).astype('int64')
 
     # ----------------------------------------------------------------------
     # 7. Get FSN for the inactivation reason
     # ----------------------------------------------------------------------
-    spinner.start("Retrieving FSN for the inactivation reason...")
-    reason_fsn_df = desc_df[
-        (desc_df['typeId'] == '900000000000003001') & 
-        (desc_df['active'] == '1')
-    ][['conceptId','term']].drop_duplicates()
-
-    reason_fsn_df.rename(
-        columns={
-            'conceptId': 'reasonId',
-            'term': 'inactivationReasonFSN'
-        },
-        inplace=True
-    )
-
-    merged_df = pd.merge(
-        merged_df,
-        reason_fsn_df,
-        how='left',
-        left_on='inactivationReasonId',
-        right_on='reasonId'
-    )
-    spinner.succeed("FSN for inactivation reason retrieved.")
-
-    merged_df['inactivationReasonFSN'] = merged_df['inactivationReasonFSN_y'].fillna(
-        merged_df['inactivationReasonFSN_x']
-    )
-    merged_df.drop(['inactivationReasonFSN_x', 'inactivationReasonFSN_y'], axis=1, inplace=True)
+    merged_df['inactivationReasonFSN'] = pd.Series(
+        fsn_lookup.terms(merged_df['inactivationReasonId']), index=merged_df.index
+    ).fillna('Not specified')
 
     # ----------------------------------------------------------------------
     # 8. Load & merge Historical Associations
     # ----------------------------------------------------------------------
     spinner.start("Loading Historical Associations (Full) reference set...")
-    hist_df = pd.read_csv(
+    hist_df = load_rf2(
         refset_historical_associations_path,
-        sep='\t',
-        dtype=str,
-        on_bad_lines='skip'
+        "refset_historical",
+        columns=['id', 'effectiveTime', 'active', 'refsetId', 'referencedComponentId', 'targetComponentId']
     )
 
     HISTORICAL_REFSETS = [
-        '900000000000531004',  # REFERS TO
-        '900000000000530003',  # ALTERNATIVE
-        '900000000000529008',  # SIMILAR TO
-        '900000000000528000',  # WAS A
-        '900000000000527005',  # SAME AS
-        '900000000000526001',  # REPLACED BY
-        '900000000000525002',  # MOVED FROM
-        '900000000000524003',  # MOVED TO
-        '900000000000523009',  # POSSIBLY EQUIVALENT TO
-        '900000000000522004',  # Historical association reference set (parent)
-        '1186924009',          # PARTIALLY EQUIVALENT TO
-        '1186921001',          # POSSIBLY REPLACED BY
+        900000000000531004,  # REFERS TO
+        900000000000530003,  # ALTERNATIVE
+        900000000000529008,  # SIMILAR TO
+        900000000000528000,  # WAS A
+        900000000000527005,  # SAME AS
+        900000000000526001,  # REPLACED BY
+        900000000000525002,  # MOVED FROM
+        900000000000524003,  # MOVED TO
+        900000000000523009,  # POSSIBLY EQUIVALENT TO
+        900000000000522004,  # Historical association reference set (parent)
+        1186924009,          # PARTIALLY EQUIVALENT TO
+        1186921001,          # POSSIBLY REPLACED BY
     ]
 
     hist_df = hist_df[hist_df['refsetId'].isin(HISTORICAL_REFSETS)]
@@ -244,62 +151,37 @@ def detect_inactivations(concept_full_path,
         'targetComponentId': 'targetConceptId'
     }, inplace=True)
 
-    hist_df['effectiveTime'] = hist_df['effectiveTime'].astype(int)
-    hist_df['active'] = hist_df['active'].fillna('0').astype(int)
-    hist_df['historicalRefsetId'] = hist_df['historicalRefsetId'].astype(int, errors='ignore')
-    hist_df['conceptId'] = hist_df['conceptId'].astype(int, errors='ignore')
-    hist_df['targetConceptId'] = hist_df['targetConceptId'].astype(int, errors='ignore')
-
-    hist_df = hist_df[hist_df['active'] == 1]
+    hist_df = hist_df.astype({'historicalRefsetId': 'Int64', 'targetConceptId': 'Int64'})
 
-    hist_merge = pd.merge(
+    # Pair each inactivation with the association members of its concept, then
+    # take every member's latest row at or before the inactivation date and keep
+    # the members that were active at that point.
+    member_events = pd.merge(
         merged_df[['conceptId','inactivationEffectiveTime']],
-        hist_df[['conceptId','historicalRefsetId', 'targetConceptId','effectiveTime']],
-        on='conceptId',
-        how='left'
+        hist_df[['id', 'conceptId']].drop_duplicates(),
+        on='conceptId'
     )
-
-    hist_merge = hist_merge[
-        hist_merge['effectiveTime'].isna() |
-        (hist_merge['effectiveTime'] <= hist_merge['inactivationEffectiveTime'])
-    ]
+    hist_merge = asof_join(
+        member_events,
+        hist_df[['id', 'effectiveTime', 'active', 'historicalRefsetId', 'targetConceptId']],
+        on='inactivationEffectiveTime',
+        by='id'
+    )
+    hist_merge = hist_merge[hist_merge['active'] == 1]
 
     hist_merge.sort_values(
         by=['conceptId','inactivationEffectiveTime','effectiveTime'],
+        kind='stable',
         inplace=True
     )
 
-    hist_fsn_df = desc_df[
-        (desc_df['typeId'] == '900000000000003001') &
-        (desc_df['active'] == '1')
-    ][['conceptId','term']].drop_duplicates()
-
-    hist_fsn_df['conceptId'] = hist_fsn_df['conceptId'].astype(int)
-
-    hist_merge = pd.merge(
-        hist_merge,
-        hist_fsn_df,
-        left_on='historicalRefsetId',
-        right_on='conceptId',
-        how='left',
-        suffixes=('', '_historical')
-    )
-
-    hist_merge = pd.merge(
-        hist_merge,
-        hist_fsn_df,
-        left_on='targetConceptId',
-        right_on='conceptId',
-        how='left',
-        suffixes=('', '_target')
-    )
     # remove the parent text if present
-    hist_merge['term'] = hist_merge['term'].str.replace(
-        'association reference set (foundation metadata concept)', ''
-    )
+    historical_fsn = pd.Series(
+        fsn_lookup.terms(hist_merge['historicalRefsetId']), index=hist_merge.index
+    ).str.replace('association reference set (foundation metadata concept)', '')
+    target_fsn = fsn_lookup.terms(hist_merge['targetConceptId'])
 
-    hist_merge['term'] = hist_merge['term'] + ' -> ' + hist_merge['term_target']
-    hist_merge.rename(columns={'conceptId_x': 'conceptId'}, inplace=True)
+    hist_merge['term'] = historical_fsn + ' -> ' + target_fsn
 
     grouped_hist = hist_merge.groupby(
         ['conceptId','inactivationEffectiveTime'],
@@ -339,12 +221,16 @@ def detect_inactivations(concept_full_path,
         'inactivationReasonFSN',
         'historicalAssociations'
     ]]
-    merged_df.sort_values('conceptId', inplace=True)
+    merged_df = merged_df.sort_values('conceptId').reset_index(drop=True)
     spinner.succeed("Output data finalized.")
 
-    spinner.start(f"Writing results to: {output_path}")
-    merged_df.to_excel(output_path, index=False, sheet_name='Inactivations')
-    spinner.succeed(f"Results successfully written to {output_path}")
+    if output_path:
+        spinner.start(f"Writing results to: {output_path}")
+        # Excel stores numbers as doubles, so SCTIDs (up to 18 digits) are written as text
+        merged_df.astype({'conceptId': str, 'inactivationReasonId': str}).to_excel(output_path, index=False, sheet_name='Inactivations')
+        spinner.succeed(f"Results successfully written to {output_path}")
+
+    return merged_df
 
 
 if __name__ == '__main__':
@@ -1,28 +1,50 @@
 #!/usr/bin/env python3
-import json
 import pandas as pd
-import plotly.graph_objects as go
 from halo import Halo
-import numpy as np
-from matplotlib import cm
 import plotly.express as px
-from ci_utils import is_ci, convert_numpy_types
+from ci_utils import is_ci
+from report_utils import (
+    bar_trace,
+    build_group_index,
+    cell_details,
+    prepare_columns,
+    stacked_bar_layout,
+    write_detail_shards,
+    write_report_html,
+    year_zoom_ranges,
+)
 
 def generate_inactivation_report(
-    inactivation_data_path: str,
+    inactivation_data,
     output_path: str,
-    heads_size = 500
+    heads_size = 500,
+    details_dir: str = None,
+    details_url: str = None,
+    runtime_url: str = ""
 ):
     """
-    Generate an interactive HTML report of concept inactivations from an Excel file
-    (detect-inactivations.xlsx), grouped by EffectiveTime and Inactivation Reason.
+    Generate an interactive HTML report of concept inactivations, grouped by
+    EffectiveTime and Inactivation Reason.
 
     Parameters
     ----------
-    file_path : str
-        Path to the Excel file containing inactivation data.
+    inactivation_data : pd.DataFrame or str
+        DataFrame returned by detect_inactivations, or path to the Excel file
+        containing inactivation data (detect-inactivations.xlsx).
     output_path : str
         Path where the output HTML report should be written.
+    heads_size : int
+        Maximum number of example rows shown when clicking a bar.
+    details_dir : str, optional
+        If given, the example rows of each bar segment are written as separate
+        JSON files to this directory and fetched on click, instead of being
+        embedded in the HTML.
+    details_url : str, optional
+        URL the page uses to fetch files from details_dir. Defaults to the
+        directory name, relative to the HTML file.
+    runtime_url : str, optional
+        URL prefix the page uses to load report-runtime.js/.css, which are
+        copied next to output_path. Defaults to the HTML file's directory.
     """
     if not is_ci():
         print("Generating Inactivation Report...")
@@ -33,7 +55,10 @@ def generate_inactivation_report(
     # --- Load Dataset ---
     spinner.start("Loading dataset...")
     try:
-        df = pd.read_excel(inactivation_data_path)
+        if isinstance(inactivation_data, pd.DataFrame):
+            df = inactivation_data.copy()
+        else:
+            df = pd.read_excel(inactivation_data)
         spinner.succeed("Dataset loaded successfully.")
     except Exception as e:
         spinner.fail(f"Error loading dataset: {e}")
@@ -69,256 +94,74 @@ def generate_inactivation_report(
     # --- Group Data ---
     spinner.start("Grouping data by Effective Time and Inactivation Reason...")
     grouped = df.groupby(["inactivationEffectiveTime", "inactivationReasonFSN"], observed=False).size().unstack(fill_value=0)
+    group_index = build_group_index(df, "inactivationEffectiveTime", "inactivationReasonFSN")
+    example_columns = prepare_columns(df)
     spinner.succeed("Data grouped successfully.")
 
-    # --- Create Plotly Figure ---
-    spinner.start("Generating Plotly visualization...")
-    fig = go.Figure()
+    detail_urls = None
+    if details_dir:
+        spinner.start(f"Writing detail files to {details_dir}...")
+        detail_urls = write_detail_shards(
+            example_columns, group_index, grouped.index, grouped.columns, heads_size, details_dir, details_url
+        )
+        spinner.succeed(f"{len(detail_urls)} detail files written.")
 
-    # Compute total counts
+    # --- Plotly Traces ---
+    # Plain trace dicts, generated one at a time while the HTML is written
     total_counts = grouped.sum(axis=1)
-
-    # Add traces for each inactivation reason
-    for reason in grouped.columns:
-        fig.add_trace(go.Bar(
-            x=grouped.index.tolist(),
-            y=grouped[reason].values,
-            name=reason,
-            customdata=[
-                {
-                    "InactivationReason": reason,
-                    "TotalCount": total_counts[time],
-                    "Examples": df[(df["inactivationEffectiveTime"] == time) & (df["inactivationReasonFSN"] == reason)].head(heads_size).to_dict('records'),
-                    "heads_size": heads_size
-                }
-                for time in grouped.index
-            ],
-            hovertemplate=(
-                "<b>Inactivation Reason:</b> %{customdata.InactivationReason}<br>"
-                "<b>Count:</b> %{y}<br>"
-                "<b>Effective Time:</b> %{x}<br>"
-                "<b>Total Count:</b> %{customdata.TotalCount}<extra></extra>"
-            ),
-        ))
-    spinner.succeed("Plotly visualization created.")
-
-    # --- Update Layout ---
+    times = grouped.index.tolist()
+
+    def traces():
+        for reason in grouped.columns:
+            yield bar_trace(
+                reason,
+                times,
+                grouped[reason].to_numpy(),
+                [
+                    {
+                        "InactivationReason": reason,
+                        "TotalCount": total_counts[time],
+                        **cell_details(example_columns, group_index, time, reason, heads_size, detail_urls),
+                        "heads_size": heads_size
+                    }
+                    for time in grouped.index
+                ],
+                (
+                    "<b>Inactivation Reason:</b> %{customdata.InactivationReason}<br>"
+                    "<b>Count:</b> %{y}<br>"
+                    "<b>Effective Time:</b> %{x}<br>"
+                    "<b>Total Count:</b> %{customdata.TotalCount}<extra></extra>"
+                ),
+            )
+
+    # --- Layout ---
     spinner.start("Configuring chart layout...")
-    # Generate a continuous color scale with colors for each reason
-    num_colors = len(grouped.columns)
-    continuous_palette = [cm.turbo(i) for i in np.linspace(0, 1, num_colors)]
-    continuous_palette = [
-        'rgb({},{},{})'.format(int(r*255), int(g*255), int(b*255)) 
-        for r, g, b, _ in continuous_palette
-    ]
-
-    fig.update_layout(
-        colorway=px.colors.qualitative.Plotly,
+    layout = stacked_bar_layout(
         title="Inactivation Reasons by Effective Time",
         xaxis_title="Effective Time",
         yaxis_title="Count",
-        barmode="stack",
         legend_title="Inactivation Reason",
-        xaxis=dict(type="category", tickangle=45),
+        colorway=px.colors.qualitative.Plotly,
         height=600,
     )
     spinner.succeed("Chart layout configured.")
 
-    # --- Generate JSON for HTML ---
-    spinner.start("Generating Plotly JSON...")
-    # Use json.dumps to ensure arrays are serialized as JSON arrays, not binary format
-    # Convert NumPy types to native Python types for JSON serialization
-    fig_dict = convert_numpy_types(fig.to_dict())
-    fig_json = json.dumps(fig_dict)
-    spinner.succeed("Plotly JSON generated.")
-
-    # --- HTML Template ---
-    spinner.start("Creating interactive HTML template...")
-    html_template = """
-    <html>
-    <head>
-        <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;500&display=swap');
-            body {
-                font-family: 'Roboto', sans-serif;
-            }
-            .hover-row {
-                transition: background-color 0.2s;
-            }
-            .hover-row:hover {
-                background-color: #dbdbdb;
-            }
-        </style>
-    </head>
-    <body>
-        <div id="year-buttons"></div>
-        <div id="chart" style="width:100%;height:80%;"></div>
-        <div id="details" style="margin-top:10px;border:1px solid black;padding:10px;">
-            <h3 id="details-title">Details</h3>
-            <div id="details-content">Click on a bar to see details here.</div>
-        </div>
-        <script>
-            var data = REPLACE_ME_WITH_JSON;
-            Plotly.newPlot('chart', data.data, data.layout);
-
-            function attachPlotlyClickHandler() {
-                var chart = document.getElementById('chart');
-                if (!chart) {
-                    console.error("Error: Chart element not found.");
-                    return;
-                }
-                chart.removeAllListeners && chart.removeAllListeners('plotly_click');
-                chart.on('plotly_click', function(data) {
-                    var detailsDiv = document.getElementById('details-content');
-                    var titleDiv = document.getElementById('details-title');
-                    var point = data.points[0];
-                    var examples = point.customdata.Examples;
-
-                    if (point.y > point.customdata.heads_size) {
-                        titleDiv.textContent = `Details for ${point.customdata.SemanticTag} - ${point.x} (first ${point.customdata.heads_size} rows of ${point.y})`;
-                    } else {
-                        titleDiv.textContent = `Details for ${point.customdata.SemanticTag} - ${point.x} (all ${point.y} rows)`;
-                    }
-
-                    if (examples && examples.length > 0) {
-                        var detailsHtml = `
-                            <table style="border-collapse: collapse; width: 100%;">
-                                <thead>
-                                    <tr>
-                                        <th style="border: 1px solid #000; padding: 8px;">ConceptId</th>
-                                        <th style="border: 1px solid #000; padding: 8px;">FSN</th>
-                                        <th style="border: 1px solid #000; padding: 8px;">Inactivation Reason</th>
-                                        <th style="border: 1px solid #000; padding: 8px;">Historical Associations</th>
-                                    </tr>
-                                </thead>
-                                <tbody>
-                        `;
-                        examples.forEach(function(example) {
-                            detailsHtml += `
-                                <tr class="hover-row">
-                                    <td style="border: 1px solid #000; padding: 8px;">${example.conceptId}</td>
-                                    <td style="border: 1px solid #000; padding: 8px;">${example.FSN}</td>
-                                    <td style="border: 1px solid #000; padding: 8px;">${example.inactivationReasonFSN}</td>
-                                    <td style="border: 1px solid #000; padding: 8px;">${example.historicalAssociations}</td>
-                                </tr>
-                            `;
-                        });
-                        detailsHtml += `</tbody></table>`;
-                        detailsDiv.innerHTML = detailsHtml;
-                    } else {
-                        detailsDiv.innerHTML = 'No examples available.';
-                    }
-                });
-            }
-
-            function zoomToYear(year) {
-                var chart = document.getElementById('chart');
-                if (!data || !data.data || !data.data[0] || !data.data[0].x) {
-                    console.error("Error: Data is not properly defined.");
-                    alert("Chart data is unavailable.");
-                    return;
-                }
-
-                var xData = data.data[0].x;
-                var yearStr = year.toString();
-                var filteredDates = xData.filter(date => date.startsWith(yearStr));
-                if (filteredDates.length === 0) {
-                    alert(`No data available for ${year}`);
-                    return;
-                }
-                filteredDates.sort();
-                var minDate = filteredDates[0];
-                var maxDate = filteredDates[filteredDates.length - 1];
-                var idxMin = xData.indexOf(minDate);
-                var idxMax = xData.lastIndexOf(maxDate);
-                if (idxMin === -1 || idxMax === -1) {
-                    console.error(`Error: Unable to find indices for ${minDate} - ${maxDate}`);
-                    alert(`Unexpected error zooming to ${year}`);
-                    return;
-                }
-                var rangeMin = Math.max(0, idxMin - 0.5);
-                var rangeMax = idxMax + 0.5;
-
-                var summedYValues = Array(xData.length).fill(0);
-                data.data.forEach(trace => {
-                    if (trace.y && trace.x) {
-                        trace.y.forEach((yValue, index) => {
-                            if (!isNaN(yValue) && yValue !== undefined) {
-                                summedYValues[index] += yValue;
-                            }
-                        });
-                    }
-                });
-                var maxY = Math.max(...summedYValues.slice(idxMin, idxMax + 1));
-
-                Plotly.relayout(chart, {
-                    "xaxis.type": "category",
-                    "xaxis.range": [rangeMin, rangeMax],
-                    "yaxis.range": [0, maxY * 1.1]
-                }).then(() => attachPlotlyClickHandler());
-            }
-
-            function generateYearButtons() {
-                if (!data || !data.data || !data.data[0] || !data.data[0].x) {
-                    console.error("Error: Data is not properly defined.");
-                    return;
-                }
-                var xData = data.data[0].x;
-                var years = [...new Set(xData.map(date => date.substring(0, 4)))]
-                    .filter(year => parseInt(year) > 2021)
-                    .sort();
-
-                var container = document.getElementById('year-buttons');
-                container.innerHTML = "";
-
-                var zoomSpan = document.createElement("span");
-                zoomSpan.textContent = "Zoom: ";
-                container.appendChild(zoomSpan);
-
-                var resetButton = document.createElement("button");
-                resetButton.textContent = "Reset";
-                resetButton.style.marginRight = "10px";
-                resetButton.onclick = resetZoom;
-                container.appendChild(resetButton);
-
-                years.forEach(year => {
-                    var button = document.createElement("button");
-                    button.textContent = `${year}`;
-                    button.style.marginRight = "5px";
-                    button.onclick = () => zoomToYear(year);
-                    container.appendChild(button);
-                });
-            }
-
-            function resetZoom() {
-                var chart = document.getElementById('chart');
-                if (!data || !data.layout || !data.data) {
-                    console.error("Error: Data is not properly defined.");
-                    alert("Chart data is unavailable.");
-                    return;
-                }
-                Plotly.relayout(chart, {
-                    "xaxis.autorange": true,
-                    "yaxis.autorange": true
-                }).then(() => attachPlotlyClickHandler());
-            }
-
-            setTimeout(generateYearButtons, 100);
-            setTimeout(attachPlotlyClickHandler, 100);
-        </script>
-    </body>
-    </html>
-    """
-    spinner.succeed("HTML template created.")
-
-    # --- Insert JSON & Save File ---
+    # --- Runtime Options ---
+    options = {
+        "categoryKey": "InactivationReason",
+        "columns": [
+            {"field": "conceptId", "header": "ConceptId"},
+            {"field": "FSN", "header": "FSN"},
+            {"field": "inactivationReasonFSN", "header": "Inactivation Reason"},
+            {"field": "historicalAssociations", "header": "Historical Associations"},
+        ],
+        "zoomYears": year_zoom_ranges(times, total_counts, 2022),
+    }
+
+    # --- Insert Figure JSON & Save File ---
     spinner.start(f"Writing final HTML to {output_path}...")
-    html_output = html_template.replace("REPLACE_ME_WITH_JSON", fig_json)
-
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(html_output)
+        write_report_html(traces(), layout, options, output_path, runtime_url)
         spinner.succeed(f"HTML file with interactive chart created: {output_path}")
     except Exception as e:
         spinner.fail(f"Error writing HTML file: {e}")
@@ -335,6 +178,6 @@ if __name__ == "__main__":
     DEFAULT_OUTPUT_PATH = "sct-changes-reports/detect_inactivations_by_reason.html"
 
     generate_inactivation_report(
-        inactivation_data_path=DEFAULT_INPUT_PATH,
+        inactivation_data=DEFAULT_INPUT_PATH,
         output_path=DEFAULT_OUTPUT_PATH
     )
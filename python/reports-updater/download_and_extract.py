@@ -1,16 +1,74 @@
+import hashlib
+import math
 import os
+import re
+import threading
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_EXCEPTION
 import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 from tqdm import tqdm
 from ci_utils import is_ci, log
+from file_locator import ZipRelease, release_manifest
 
-def download_and_extract_snomed(url, output_dir="data"):
+# Download tuning, can be set in .env
+DOWNLOAD_CHUNK_MB = float(os.getenv("SNOMED_DOWNLOAD_CHUNK_MB", "8"))
+DOWNLOAD_RETRIES = int(os.getenv("SNOMED_DOWNLOAD_RETRIES", "5"))
+# Concurrent Range requests of one download (1: single stream)
+DOWNLOAD_CONNECTIONS = int(os.getenv("SNOMED_DOWNLOAD_CONNECTIONS", "1"))
+# Byte ranges per connection of a parallel download, so connections that finish
+# early take over work from slower ones
+SEGMENTS_PER_CONNECTION = 4
+
+RETRY_BACKOFF_SECONDS = 2
+MAX_BACKOFF_SECONDS = 60
+# Server errors worth retrying (rate limiting, gateway/server failures)
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# (connect, read) timeouts, so a stalled connection is retried instead of hanging
+REQUEST_TIMEOUT = (30, 120)
+
+def download_and_extract_snomed(url, output_dir="data", expected_size=None, expected_sha256=None,
+                                tables=None):
     """
     Download the SNOMED International release ZIP (with authentication) and extract it.
     Returns the path to the extracted folder.
+
+    tables, a list of (file_type, release_type) pairs as accepted by
+    file_locator.getFilePath, limits the extraction to those RF2 files.
+    """
+    zip_path = download_snomed(url, output_dir, expected_size, expected_sha256)
+    members = release_manifest(ZipRelease(zip_path), tables) if tables else None
+    return extract_snomed(zip_path, output_dir, members)
+
+
+def download_snomed(url, output_dir="data", expected_size=None, expected_sha256=None,
+                    chunk_size_mb=None, max_retries=None, connections=None):
+    """
+    Download the SNOMED International release ZIP (with authentication) without
+    extracting it. Returns the path to the ZIP file, which can be opened with
+    file_locator.ZipRelease to read RF2 files in place.
+
+    The ZIP is written to snomed_release.zip.part first. A dropped or stalled
+    connection is retried with exponential backoff, resuming with an HTTP Range
+    request from the bytes already on disk; a .part file left by an earlier run
+    is resumed the same way. max_retries (default SNOMED_DOWNLOAD_RETRIES)
+    counts consecutive attempts that made no progress.
+
+    When the feed provides them, expected_size (bytes) and expected_sha256 (hex)
+    are checked before the .part file is renamed to the ZIP; a mismatching file
+    is deleted and a RuntimeError raised. chunk_size_mb (default
+    SNOMED_DOWNLOAD_CHUNK_MB) sets the read/write block size.
+
+    With connections > 1 (default SNOMED_DOWNLOAD_CONNECTIONS) the file is
+    fetched as byte ranges over that many concurrent connections (see
+    download_ranges); servers that do not serve Range requests are downloaded
+    as a single stream.
     """
     os.makedirs(output_dir, exist_ok=True)
     zip_path = os.path.join(output_dir, "snomed_release.zip")
+    part_path = zip_path + ".part"
+    chunk_size = int((chunk_size_mb or DOWNLOAD_CHUNK_MB) * 1024 * 1024)
 
     # Extract filename from URL for logging
     url_filename = os.path.basename(url.split('?')[0]) if url else "unknown"
@@ -19,56 +77,399 @@ def download_and_extract_snomed(url, output_dir="data"):
     
     if not is_ci():
         print(f"Downloading SNOMED release...")
-    auth_user = os.getenv("SNOMED_USER")
-    auth_pass = os.getenv("SNOMED_PASSWORD")
+    connections = connections or DOWNLOAD_CONNECTIONS
+    session = mlds_session(connections)
+
+    total_size = None
+    if connections > 1:
+        total_size = _download_parallel(session, url, part_path, connections, chunk_size, max_retries)
+    if total_size is None:
+        if os.path.exists(part_path + ".ranges"):
+            # Preallocated by an interrupted parallel download: not a beginning to append to
+            os.remove(part_path)
+            os.remove(part_path + ".ranges")
+        total_size = download_with_retries(
+            lambda: _download_to(session, url, part_path, chunk_size),
+            lambda: _file_size(part_path),
+            max_retries
+        )
 
-    # Create a session to handle cookies/session-based auth
+    verify_download(part_path, expected_size or total_size, expected_sha256)
+    os.replace(part_path, zip_path)
+
+    if not is_ci():
+        print(f"✓ Downloaded {os.path.getsize(zip_path) / (1024*1024):.1f} MB")
+    return zip_path
+
+
+def mlds_session(connections=1):
+    """
+    requests session with the MLDS credentials (SNOMED_USER / SNOMED_PASSWORD)
+    that keeps up to connections keep-alive connections per host, so the
+    requests of a parallel download reuse them instead of reconnecting.
+    """
     session = requests.Session()
-    session.auth = (auth_user, auth_pass)
-    
-    # Download with progress bar (disabled in CI)
-    with session.get(url, stream=True) as r:
-        if r.status_code == 401:
-            raise RuntimeError(
-                f"Authentication failed (401 Unauthorized).\n"
-                f"Username: {auth_user}\n"
-                f"Download URL: {url[:100]}...\n\n"
-                f"Please verify:\n"
-                f"  1. Your credentials are correct at https://mlds.ihtsdotools.org/\n"
-                f"  2. You can download files manually from the website\n"
-                f"  3. Your account has 'Member' or 'Affiliate' status\n"
-                f"  4. Your account has access to SNOMED CT International Edition\n\n"
-                f"Note: Access to the syndication feed (list) is public,\n"
-                f"but downloading files requires proper MLDS membership."
-            )
+    session.auth = (os.getenv("SNOMED_USER"), os.getenv("SNOMED_PASSWORD"))
+    adapter = HTTPAdapter(pool_maxsize=max(connections, DEFAULT_POOLSIZE))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def download_with_retries(attempt, progress, max_retries=None, cancelled=None):
+    """
+    Calls attempt() until it returns, and returns its result. Dropped or stalled
+    connections and RETRY_STATUS_CODES responses are retried with exponential
+    backoff; attempt is expected to resume where the previous one stopped.
+    progress() returns the bytes downloaded so far: only attempts that got no
+    further count towards max_retries (default SNOMED_DOWNLOAD_RETRIES).
+    cancelled (a threading.Event) ends the backoff wait early: once it is set,
+    _DownloadCancelled is raised instead of retrying.
+    """
+    if max_retries is None:
+        max_retries = DOWNLOAD_RETRIES
+    failures = 0
+    while True:
+        downloaded = progress()
+        try:
+            return attempt()
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                requests.HTTPError) as e:
+            if isinstance(e, requests.HTTPError) and e.response.status_code not in RETRY_STATUS_CODES:
+                raise
+            failures = 1 if progress() > downloaded else failures + 1
+            if failures > max_retries:
+                raise RuntimeError(f"Download failed after {max_retries} retries: {e}") from e
+            delay = min(RETRY_BACKOFF_SECONDS * 2 ** (failures - 1), MAX_BACKOFF_SECONDS)
+            log(f"⚠ Download interrupted at {progress()} bytes ({e})")
+            log(f"   Resuming in {delay:.0f}s (retry {failures}/{max_retries})")
+            if cancelled is None:
+                time.sleep(delay)
+            elif cancelled.wait(delay):
+                raise _DownloadCancelled() from e
+
+
+def check_authentication(response, user, url):
+    """Raises a RuntimeError explaining the MLDS requirements on a 401 response."""
+    if response.status_code == 401:
+        raise RuntimeError(
+            f"Authentication failed (401 Unauthorized).\n"
+            f"Username: {user}\n"
+            f"Download URL: {url[:100]}...\n\n"
+            f"Please verify:\n"
+            f"  1. Your credentials are correct at https://mlds.ihtsdotools.org/\n"
+            f"  2. You can download files manually from the website\n"
+            f"  3. Your account has 'Member' or 'Affiliate' status\n"
+            f"  4. Your account has access to SNOMED CT International Edition\n\n"
+            f"Note: Access to the syndication feed (list) is public,\n"
+            f"but downloading files requires proper MLDS membership."
+        )
+
+
+def strong_etag(response):
+    """ETag of response if it is a strong validator (If-Range only accepts those), else None."""
+    etag = response.headers.get("ETag")
+    if etag and etag.startswith("W/"):
+        return None
+    return etag
+
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _download_to(session, url, part_path, chunk_size):
+    """
+    One download attempt: appends the rest of the file to part_path, or starts
+    it over if the server does not honour the Range request. Returns the total
+    size announced by the server (None if unknown).
+    """
+    offset = _file_size(part_path)
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with session.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+        check_authentication(r, session.auth[0], url)
+        if r.status_code == 416 and offset:
+            # Nothing after offset: the .part file is complete, unless it does
+            # not match the file on the server, then start over
+            total_size = parse_content_range(r.headers.get("content-range"))[1]
+            if total_size == offset:
+                return total_size
+            log(f"⚠ Partial download does not match the server file; starting over")
+            os.remove(part_path)
+            return _download_to(session, url, part_path, chunk_size)
         r.raise_for_status()
-        
-        # Get total file size
-        total_size = int(r.headers.get('content-length', 0))
-        
+
+        if r.status_code == 206:
+            start, total_size = parse_content_range(r.headers.get("content-range"))
+            if start is None or start > offset:
+                # Cannot be appended to what is on disk: start over on the retry
+                os.remove(part_path)
+                raise requests.ConnectionError(f"Unexpected Content-Range: {r.headers.get('content-range')}")
+            if offset:
+                log(f"↻ Resuming download at {start / (1024*1024):.1f} MB")
+        else:
+            # Full response: the server ignored the Range header
+            if offset:
+                log("⚠ Server does not support resuming; downloading from the start")
+            start = 0
+            total_size = int(r.headers.get('content-length', 0)) or None
+
         # Download with progress bar (disabled in CI)
-        with open(zip_path, "wb") as f:
+        with open(part_path, "r+b" if start else "wb") as f:
+            f.truncate(start)
+            f.seek(start)
             with tqdm(
                 total=total_size,
+                initial=start,
                 unit='B',
                 unit_scale=True,
                 unit_divisor=1024,
                 desc="Download progress",
                 disable=is_ci()
             ) as pbar:
-                for chunk in r.iter_content(chunk_size=8192):
+                for chunk in r.iter_content(chunk_size=chunk_size):
                     f.write(chunk)
                     pbar.update(len(chunk))
 
+    size = _file_size(part_path)
+    if total_size and size < total_size:
+        raise requests.ConnectionError(f"Connection closed after {size} of {total_size} bytes")
+    return total_size
+
+
+class _DownloadCancelled(Exception):
+    pass
+
+
+def download_ranges(session, url, path, start, end, connections, chunk_size, max_retries=None,
+                    etag=None, on_progress=None, pbar=None):
+    """
+    Downloads bytes [start, end) of url into path, an existing file at least
+    end bytes long, over up to connections concurrent Range requests.
+
+    The range is split into SEGMENTS_PER_CONNECTION segments per connection
+    (at least chunk_size bytes each), requested in file order by a pool of
+    connections threads; each thread writes its segment at its offset with
+    os.pwrite. A segment whose connection drops is resumed from where it
+    stopped (download_with_retries, max_retries per segment). With etag (a
+    strong ETag of the file) every request carries If-Range, so a file
+    replaced on the server is detected instead of mixed with the old one.
+
+    on_progress(position) is called whenever the contiguous downloaded range
+    [start, position) grows, and pbar (a tqdm bar) is updated with every
+    chunk. If a segment fails, the other threads are stopped and the error
+    is raised; [start, position) is complete on disk at that point.
+    """
+    segment_size = max(chunk_size, math.ceil((end - start) / (connections * SEGMENTS_PER_CONNECTION)))
+    segments = [(offset, min(offset + segment_size, end)) for offset in range(start, end, segment_size)]
+    done = [0] * len(segments)
+    first_incomplete = 0
+    lock = threading.Lock()
+    cancelled = threading.Event()
+
+    def advance(i, n):
+        nonlocal first_incomplete
+        with lock:
+            done[i] += n
+            if pbar is not None:
+                pbar.update(n)
+            if i != first_incomplete:
+                return
+            while first_incomplete < len(segments) and \
+                    done[first_incomplete] == segments[first_incomplete][1] - segments[first_incomplete][0]:
+                first_incomplete += 1
+            if on_progress is not None:
+                if first_incomplete < len(segments):
+                    on_progress(segments[first_incomplete][0] + done[first_incomplete])
+                else:
+                    on_progress(end)
+
+    def fetch_segment(i):
+        segment_start, segment_end = segments[i]
+
+        def attempt():
+            position = segment_start + done[i]
+            headers = {"Range": f"bytes={position}-{segment_end - 1}"}
+            if etag:
+                headers["If-Range"] = etag
+            with session.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+                check_authentication(r, session.auth[0], url)
+                r.raise_for_status()
+                if r.status_code != 206 or parse_content_range(r.headers.get("content-range"))[0] != position:
+                    raise RuntimeError("File changed on the server during the download")
+                # Read to the end of the response, so its connection goes back to the pool
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if cancelled.is_set():
+                        raise _DownloadCancelled()
+                    chunk = chunk[:segment_end - position]
+                    if not chunk:
+                        # More than the requested range
+                        break
+                    _write_at(fd, position, chunk)
+                    position += len(chunk)
+                    advance(i, len(chunk))
+            if position == segment_end:
+                return
+            raise requests.ConnectionError(
+                f"Connection closed after {position - segment_start} of {segment_end - segment_start} bytes of a range"
+            )
+
+        if not cancelled.is_set():
+            download_with_retries(attempt, lambda: done[i], max_retries, cancelled)
+
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="range-download") as pool:
+            futures = [pool.submit(fetch_segment, i) for i in range(len(segments))]
+            finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            errors = [future.exception() for future in finished if future.exception() is not None]
+            if errors:
+                cancelled.set()
+                for future in futures:
+                    future.cancel()
+                raise errors[0]
+    finally:
+        cancelled.set()
+        os.close(fd)
+
+
+def _write_at(fd, offset, data):
+    view = memoryview(data)
+    while view:
+        written = _pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    # No os.pwrite on Windows: positioned write on a handle of this thread
+    with open(fd, "r+b", closefd=False) as f:
+        f.seek(offset)
+        return f.write(data)
+
+
+def _download_parallel(session, url, part_path, connections, chunk_size, max_retries):
+    """
+    Downloads url to part_path with download_ranges, preallocating the file to
+    its full size. A .part file left by a single-stream download is kept and
+    only the rest is downloaded, or not downloaded again if it is complete. On
+    failure the file is cut back to its complete beginning, so a later
+    attempt resumes from there. While the download runs, part_path +
+    ".ranges" marks the file as preallocated, i.e. not complete however long
+    it is (e.g. after the process was killed).
+
+    Returns the total size, or None (nothing downloaded) if the server does
+    not answer Range requests with 206 Partial Content.
+    """
+    total_size, etag = download_with_retries(lambda: _probe_ranges(session, url), lambda: 0, max_retries)
+    if total_size is None:
+        log("⚠ Server does not support Range requests; downloading as a single stream")
+        return None
+
+    marker_path = part_path + ".ranges"
+    offset = _file_size(part_path)
+    if offset == total_size and not os.path.exists(marker_path):
+        # Completed by an earlier single-stream attempt; verified by the caller
+        log("✓ Download already complete")
+        return total_size
+    if offset >= total_size or os.path.exists(marker_path):
+        # Not a beginning of this file, or preallocated by an interrupted parallel download
+        offset = 0
+    log(f"📦 Downloading {total_size / (1024*1024):.1f} MB over {connections} connections")
+    if offset:
+        log(f"↻ Resuming download at {offset / (1024*1024):.1f} MB")
+    with open(marker_path, "w"):
+        pass
+    with open(part_path, "r+b" if offset else "wb") as f:
+        f.truncate(total_size)
+
+    complete = offset
+
+    def on_progress(position):
+        nonlocal complete
+        complete = position
+
+    with tqdm(
+        total=total_size,
+        initial=offset,
+        unit='B',
+        unit_scale=True,
+        unit_divisor=1024,
+        desc="Download progress",
+        disable=is_ci()
+    ) as pbar:
+        try:
+            download_ranges(session, url, part_path, offset, total_size, connections, chunk_size,
+                            max_retries, etag, on_progress, pbar)
+        except BaseException:
+            os.truncate(part_path, complete)
+            raise
+        finally:
+            os.remove(marker_path)
+    return total_size
+
+
+def _probe_ranges(session, url):
+    """(total size, strong ETag) of url if it serves Range requests, else (None, None)."""
+    with session.get(url, stream=True, headers={"Range": "bytes=0-0"}, timeout=REQUEST_TIMEOUT) as r:
+        check_authentication(r, session.auth[0], url)
+        r.raise_for_status()
+        total_size = parse_content_range(r.headers.get("content-range"))[1]
+        if r.status_code != 206 or total_size is None or r.headers.get("Accept-Ranges", "").lower() == "none":
+            return None, None
+        # Read the one byte, so the connection can be reused
+        r.content
+        return total_size, strong_etag(r)
+
+
+def parse_content_range(header):
+    """(first byte, total size) of a 'bytes 100-199/1000' or 'bytes */1000' header."""
+    match = re.match(r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)", header or "")
+    if not match:
+        return None, None
+    start, total = match.groups()
+    return (
+        int(start) if start is not None else None,
+        int(total) if total != "*" else None,
+    )
+
+
+def verify_download(path, expected_size=None, expected_sha256=None):
+    """Deletes path and raises RuntimeError if its size or SHA-256 is not the expected one."""
+    size = os.path.getsize(path)
+    if expected_size and size != expected_size:
+        os.remove(path)
+        raise RuntimeError(f"Downloaded file has {size} bytes, expected {expected_size}")
+    if expected_sha256:
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        if digest.lower() != expected_sha256.lower():
+            os.remove(path)
+            raise RuntimeError(f"Downloaded file has SHA-256 {digest}, expected {expected_sha256}")
+        log("✓ SHA-256 checksum verified")
+
+
+def extract_snomed(zip_path, output_dir="data", members=None, max_workers=None):
+    """
+    Extract a downloaded release ZIP into output_dir and delete the ZIP.
+    Returns the path to the extracted release folder.
+
+    members limits the extraction to those ZIP member names (see
+    file_locator.release_manifest) instead of every file of the release. The
+    members are decompressed concurrently in a thread pool, largest first;
+    each thread reads through its own handle on the ZIP.
+    """
     if not is_ci():
-        print(f"✓ Downloaded {os.path.getsize(zip_path) / (1024*1024):.1f} MB")
         print("Extracting ZIP file...")
     
     with zipfile.ZipFile(zip_path, "r") as zip_ref:
         # Log top-level folders/files in ZIP before extraction
-        members = zip_ref.namelist()
+        names = zip_ref.namelist()
         top_level_items = set()
-        for member in members:
+        for member in names:
             # Get top-level directory/file name
             top_level = member.split('/')[0] if '/' in member else member
             if top_level:
@@ -77,12 +478,39 @@ def download_and_extract_snomed(url, output_dir="data"):
         log(f"📂 Top-level items in ZIP: {', '.join(sorted(top_level_items)[:5])}")
         if len(top_level_items) > 5:
             log(f"   ... and {len(top_level_items) - 5} more items")
-        
-        # Extract with progress (disabled in CI)
-        with tqdm(total=len(members), desc="Extraction progress", disable=is_ci()) as pbar:
-            for member in members:
-                zip_ref.extract(member, output_dir)
+
+        if members is None:
+            members = names
+        sizes = {info.filename: info.file_size for info in zip_ref.infolist()}
+        members = sorted(members, key=lambda name: sizes[name], reverse=True)
+        log(f"📂 Extracting {len(members)} of {len(names)} ZIP members "
+            f"({sum(sizes[name] for name in members) / (1024*1024):.1f} MB)")
+
+    # Folders are created up front: ZipFile.extract checks for and creates the
+    # parent folder non-atomically, which races between threads
+    for name in members:
+        target_dir = os.path.dirname(os.path.normpath(os.path.join(output_dir, *name.split("/"))))
+        os.makedirs(target_dir, exist_ok=True)
+
+    local = threading.local()
+    handles = []
+
+    def extract_member(name):
+        if not hasattr(local, "zip_ref"):
+            local.zip_ref = zipfile.ZipFile(zip_path, "r")
+            handles.append(local.zip_ref)
+        local.zip_ref.extract(name, output_dir)
+
+    # Extract with progress (disabled in CI)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+                tqdm(total=len(members), desc="Extraction progress", disable=is_ci()) as pbar:
+            for future in as_completed([pool.submit(extract_member, name) for name in members]):
+                future.result()
                 pbar.update(1)
+    finally:
+        for handle in handles:
+            handle.close()
 
     # Clean up ZIP file
     os.remove(zip_path)
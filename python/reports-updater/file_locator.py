@@ -1,12 +1,56 @@
 import os
+import posixpath
 import re
+import zipfile
+from typing import NamedTuple
 
-def parse_snomed_release_date(root_folder: str) -> str:
+
+class ZipMember(NamedTuple):
+    """A file inside a release ZIP, as returned by getFilePath for a ZipRelease."""
+    zip_path: str
+    name: str
+
+    def __str__(self):
+        return f"{self.zip_path}!/{self.name}"
+
+
+class ZipRelease:
+    """
+    Handle on a SNOMED release ZIP that is read in place instead of extracted.
+    Pass it to getFilePath as root_folder to get ZipMember references that
+    rf2_loader.load_rf2 streams straight from the archive.
+    """
+
+    def __init__(self, zip_path: str):
+        self.zip_path = zip_path
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            self.members = set(zip_ref.namelist())
+
+        # Same rule as the extraction path: the top-level "SnomedCT_" folder
+        top_level = sorted({
+            member.split("/")[0] for member in self.members
+            if "/" in member and "SnomedCT_" in member.split("/")[0]
+        })
+        if not top_level:
+            raise FileNotFoundError(f"No SNOMED folder found in ZIP: {zip_path}")
+        self.root_folder = top_level[0]
+
+    def __repr__(self):
+        return f"ZipRelease({self.zip_path!r}, root_folder={self.root_folder!r})"
+
+    def member(self, name: str) -> ZipMember:
+        return ZipMember(self.zip_path, name)
+
+
+def parse_snomed_release_date(root_folder) -> str:
     """
     Extracts the YYYYMMDD date (e.g. '20250201') from the final component 
     of the root_folder name, which typically has something like:
     'SnomedCT_InternationalRF2_PRODUCTION_20250201T120000Z'.
+    root_folder may also be a ZipRelease.
     """
+    if isinstance(root_folder, ZipRelease):
+        root_folder = root_folder.root_folder
     folder_name = os.path.basename(root_folder.rstrip("/"))
     match = re.search(r'(\d{8})T\d+', folder_name)
     if not match:
@@ -15,19 +59,72 @@ def parse_snomed_release_date(root_folder: str) -> str:
         )
     return match.group(1)
 
-def getFilePath(root_folder: str, 
+
+# RF2 concept file name, with the edition code of the release (e.g. INT)
+_CONCEPT_FILE = re.compile(r'sct2_Concept_(?:Full|Snapshot)_([A-Za-z0-9]+)_\d{8}\.txt$')
+
+
+def parse_release_edition(root_folder) -> str:
+    """
+    Returns the edition code of the RF2 file names of a release, e.g. 'INT'
+    for sct2_Concept_Full_INT_20250201.txt or 'US1000124' for a national
+    package, taken from its concept file. root_folder may also be a ZipRelease.
+    """
+    for name in sorted(_release_file_names(root_folder, "Terminology")):
+        match = _CONCEPT_FILE.match(name)
+        if match:
+            return match.group(1)
+    raise FileNotFoundError(f"No RF2 concept file found in release: {root_folder}")
+
+
+def _release_file_names(root_folder, sub_dir):
+    """Base names of the files under Full/ and Snapshot/<sub_dir> of a release folder or ZipRelease."""
+    if isinstance(root_folder, ZipRelease):
+        return [posixpath.basename(member) for member in root_folder.members]
+    return [
+        name
+        for segment in ("Full", "Snapshot")
+        if os.path.isdir(os.path.join(root_folder, segment, sub_dir))
+        for name in os.listdir(os.path.join(root_folder, segment, sub_dir))
+    ]
+
+
+def parse_description_languages(root_folder, edition: str = "INT"):
+    """
+    Returns the language codes of the description files of a release, e.g.
+    ['en'] for the International Edition or ['en', 'sv'] for a national
+    package that also has sct2_Description_Snapshot-sv_SE1000052_20250531.txt.
+    edition is the edition code of the file names (see parse_release_edition);
+    root_folder may also be a ZipRelease.
+    """
+    pattern = re.compile(
+        rf'sct2_Description_(?:Full|Snapshot)-([A-Za-z-]+)_{re.escape(edition)}_\d{{8}}\.txt$'
+    )
+    return sorted({
+        match.group(1)
+        for match in map(pattern.match, _release_file_names(root_folder, "Terminology"))
+        if match
+    })
+
+
+def getFilePath(root_folder, 
                 file_type: str, 
                 release_type: str, 
-                language: str = "en") -> str:
+                language: str = "en",
+                edition: str = "INT"):
     """
     Constructs the typical SNOMED file path given:
-      - root_folder: e.g. "/Users/.../SnomedCT_InternationalRF2_PRODUCTION_20250201T120000Z"
+      - root_folder: e.g. "/Users/.../SnomedCT_InternationalRF2_PRODUCTION_20250201T120000Z",
+        or a ZipRelease to address the file inside the release ZIP
       - file_type: one of ["concept", "description", "refset_inactivation", "refset_historical"]
       - release_type: one of ["full", "snapshot"] 
       - language: only used for descriptions (default "en")
+      - edition: edition code of the file names, "INT" for the International
+        Edition or e.g. "US1000124" for a national package (see parse_release_edition)
 
     Returns: absolute path to the file, e.g.:
       "/Users/.../Full/Terminology/sct2_Concept_Full_INT_20250201.txt"
+    or a ZipMember when root_folder is a ZipRelease.
     """
     # 1) Parse date from folder
     release_date = parse_snomed_release_date(root_folder)
@@ -47,13 +144,13 @@ def getFilePath(root_folder: str,
     if file_type == "concept":
         # sct2_Concept_Full_INT_YYYYMMDD.txt or
         # sct2_Concept_Snapshot_INT_YYYYMMDD.txt
-        file_name = f"sct2_Concept_{release_type.capitalize()}_INT_{release_date}.txt"
+        file_name = f"sct2_Concept_{release_type.capitalize()}_{edition}_{release_date}.txt"
         sub_dir = "Terminology"
 
     elif file_type == "description":
         # sct2_Description_Full-en_INT_YYYYMMDD.txt or
         # sct2_Description_Snapshot-en_INT_YYYYMMDD.txt
-        file_name = f"sct2_Description_{release_type.capitalize()}-{language}_INT_{release_date}.txt"
+        file_name = f"sct2_Description_{release_type.capitalize()}-{language}_{edition}_{release_date}.txt"
         sub_dir = "Terminology"
 
     elif file_type == "refset_inactivation":
@@ -62,23 +159,44 @@ def getFilePath(root_folder: str,
         # But if we did: der2_cRefset_AttributeValueSnapshot_INT_YYYYMMDD.txt
         # We'll assume "full" for inactivation; or if the user calls snapshot, we'd adapt.
         if release_type == "full":
-            file_name = f"der2_cRefset_AttributeValueFull_INT_{release_date}.txt"
+            file_name = f"der2_cRefset_AttributeValueFull_{edition}_{release_date}.txt"
         else:
-            file_name = f"der2_cRefset_AttributeValueSnapshot_INT_{release_date}.txt"
-        sub_dir = os.path.join("Refset", "Content")
+            file_name = f"der2_cRefset_AttributeValueSnapshot_{edition}_{release_date}.txt"
+        sub_dir = "Refset/Content"
 
     elif file_type == "refset_historical":
         # Typically: der2_cRefset_AssociationFull_INT_YYYYMMDD.txt
         # or        der2_cRefset_AssociationSnapshot_INT_YYYYMMDD.txt
         if release_type == "full":
-            file_name = f"der2_cRefset_AssociationFull_INT_{release_date}.txt"
+            file_name = f"der2_cRefset_AssociationFull_{edition}_{release_date}.txt"
         else:
-            file_name = f"der2_cRefset_AssociationSnapshot_INT_{release_date}.txt"
-        sub_dir = os.path.join("Refset", "Content")
+            file_name = f"der2_cRefset_AssociationSnapshot_{edition}_{release_date}.txt"
+        sub_dir = "Refset/Content"
 
     else:
         raise ValueError(f"Unknown file_type: {file_type}")
 
-    # 4) Construct the final absolute path
-    full_path = os.path.join(root_folder, folder_segment, sub_dir, file_name)
+    # 4) Construct the final absolute path (or ZIP member name)
+    if isinstance(root_folder, ZipRelease):
+        member_name = posixpath.join(root_folder.root_folder, folder_segment, sub_dir, file_name)
+        return root_folder.member(member_name)
+
+    full_path = os.path.join(root_folder, folder_segment, *sub_dir.split("/"), file_name)
     return full_path
+
+
+def release_manifest(release: ZipRelease, tables, language: str = "en", edition: str = "INT"):
+    """
+    ZIP member names of the RF2 files in tables, a list of (file_type,
+    release_type) pairs as accepted by getFilePath, e.g. the tables a set of
+    reports reads. Used to extract only those files from the release ZIP.
+    Raises FileNotFoundError if any of them is not in the ZIP.
+    """
+    names = [
+        getFilePath(release, file_type, release_type, language, edition).name
+        for file_type, release_type in tables
+    ]
+    missing = [name for name in names if name not in release.members]
+    if missing:
+        raise FileNotFoundError(f"RF2 files not found in {release.zip_path}: {', '.join(missing)}")
+    return names
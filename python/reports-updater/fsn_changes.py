@@ -1,107 +1,102 @@
 #!/usr/bin/env python3
 
-import csv
-from collections import defaultdict
+import numpy as np
 import pandas as pd
 from halo import Halo
 from ci_utils import is_ci
-
-FSN_TYPE_ID = "900000000000003001"
+from rf2_loader import load_rf2, iter_rf2, FSN_TYPE_ID
 
 def load_active_concepts(concept_snapshot_file):
     """
-    Reads the Concept Snapshot file and returns a set of active conceptIds.
+    Reads the Concept Snapshot file and returns the active conceptIds
+    as an int64 array.
     """
-    active_concepts = set()
-
-    with open(concept_snapshot_file, "r", encoding="utf-8") as f:
-        reader = csv.reader(f, delimiter="\t")
-        header = next(reader)
+    concept_df = load_rf2(concept_snapshot_file, "concept", columns=["id", "active"])
+    return concept_df.loc[concept_df["active"] == 1, "id"].to_numpy()
 
-        # Safely find column indices
-        conceptId_idx = header.index("id")
-        active_idx = header.index("active")
 
-        for row in reader:
-            if len(row) < 2:
-                continue  # Skip malformed rows
-            
-            conceptId = row[conceptId_idx]
-            active = row[active_idx]
+def _in_sorted(values, sorted_values):
+    """Vectorized membership test of values in a sorted array."""
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_values, values).clip(max=len(sorted_values) - 1)
+    return sorted_values[pos] == values
 
-            if active == "1":  # Include only active concepts
-                active_concepts.add(conceptId)
-
-    return active_concepts
 
+def load_active_fsn_history(full_description_file, active_concepts, chunksize=500_000):
+    """
+    Streams a FULL SNOMED CT RF2 description file and keeps only the rows
+    needed for FSN change detection: active FSN rows (typeId == FSN_TYPE_ID,
+    active == 1) of the given active concepts. Synonyms and inactive rows are
+    dropped chunk by chunk, so the full file is never held in memory.
 
-def load_full_description_history(full_description_file):
+    Returns a DataFrame with conceptId, effectiveTime, descriptionId and term,
+    in file order.
     """
-    Reads a FULL SNOMED CT RF2 description file and returns a dict:
-      {
-        conceptId: [
-          {
-            "descriptionId": str,
-            "effectiveTime": str,
-            "active": str ('0' or '1'),
-            "term": str,
-            "typeId": str
-          },
-          ...
-        ],
-        ...
-      }
-
-    We do NOT filter by active or typeId here. We'll keep all rows, then
-    filter them later for FSNs only.
+    columns = ["conceptId", "effectiveTime", "id", "term"]
+    # Sorted once; membership is then a binary search per candidate row
+    active_concepts = np.sort(np.asarray(active_concepts, dtype=np.int64))
+
+    chunks = []
+    for chunk in iter_rf2(
+        full_description_file,
+        "description",
+        columns=["id", "effectiveTime", "active", "conceptId", "typeId", "term"],
+        chunksize=chunksize
+    ):
+        chunk = chunk[(chunk["typeId"] == FSN_TYPE_ID) & (chunk["active"] == 1)]
+        chunks.append(chunk.loc[_in_sorted(chunk["conceptId"].to_numpy(), active_concepts), columns])
+
+    if not chunks:
+        return pd.DataFrame(columns=columns).rename(columns={"id": "descriptionId"})
+    fsn_df = pd.concat(chunks, ignore_index=True)
+    return fsn_df.rename(columns={"id": "descriptionId"})
+
+
+def find_fsn_changes(fsn_df):
     """
-    concept_history = defaultdict(list)
-
-    with open(full_description_file, "r", encoding="utf-8") as f:
-        reader = csv.reader(f, delimiter="\t")
-        header = next(reader)
-
-        # Safely find column indices
-        id_idx               = header.index("id")
-        effectiveTime_idx    = header.index("effectiveTime")
-        active_idx           = header.index("active")
-        conceptId_idx        = header.index("conceptId")
-        typeId_idx           = header.index("typeId")
-        term_idx             = header.index("term")
-
-        for row in reader:
-            # Basic sanity check for minimum columns
-            if len(row) < 9:
-                continue  # skip malformed lines
-
-            descriptionId = row[id_idx]
-            conceptId     = row[conceptId_idx]
-            typeId        = row[typeId_idx]
-            effectiveTime = row[effectiveTime_idx]
-            active        = row[active_idx]
-            term          = row[term_idx]
-
-            record = {
-                "descriptionId": descriptionId,
-                "effectiveTime": effectiveTime,
-                "active": active,
-                "term": term,
-                "typeId": typeId
-            }
-            concept_history[conceptId].append(record)
-
-    return concept_history
+    Computes consecutive FSN changes from active FSN rows (as returned by
+    load_active_fsn_history).
+
+    Rows are stable-sorted by (conceptId, effectiveTime); a row starts a new
+    FSN snapshot when it opens a concept or its term differs from the previous
+    row. Each pair of consecutive snapshots of the same concept is one change.
+    """
+    fsn_df = fsn_df.sort_values(["conceptId", "effectiveTime"], kind="stable")
+    concept_ids = fsn_df["conceptId"].to_numpy()
+    terms = fsn_df["term"].to_numpy()
+
+    same_concept = np.zeros(len(concept_ids), dtype=bool)
+    same_concept[1:] = concept_ids[1:] == concept_ids[:-1]
+    term_changed = np.ones(len(terms), dtype=bool)
+    term_changed[1:] = terms[1:] != terms[:-1]
+    snapshots = fsn_df[~same_concept | term_changed]
+
+    snapshot_ids = snapshots["conceptId"].to_numpy()
+    is_after = np.zeros(len(snapshot_ids), dtype=bool)
+    is_after[1:] = snapshot_ids[1:] == snapshot_ids[:-1]
+    is_before = np.zeros(len(snapshot_ids), dtype=bool)
+    is_before[:-1] = is_after[1:]
+
+    before = snapshots[is_before]
+    after = snapshots[is_after]
+    return pd.DataFrame({
+        "ConceptId": after["conceptId"].to_numpy(),
+        "BeforeEffectiveTime": before["effectiveTime"].to_numpy(),
+        "BeforeFSN": before["term"].to_numpy(),
+        "AfterEffectiveTime": after["effectiveTime"].to_numpy(),
+        "AfterFSN": after["term"].to_numpy(),
+    })
 
 
 def detect_fsn_changes(
     full_description_file: str,
     concept_snapshot_file: str,
-    output_path: str
+    output_path: str = None
 ):
     """
     Detects FSN (Fully Specified Name) changes for active concepts by comparing
-    consecutive FSN states over time in a FULL description file, then exports
-    those changes to Excel.
+    consecutive FSN states over time in a FULL description file.
 
     Parameters
     ----------
@@ -109,8 +104,14 @@ def detect_fsn_changes(
         Path to the FULL sct2_Description_Full-en_INT file.
     concept_snapshot_file : str
         Path to the Snapshot sct2_Concept_Snapshot_INT file (active concepts).
-    output_path : str
-        Path to the resulting .xlsx file for FSN changes.
+    output_path : str, optional
+        Path to a .xlsx file to also export the FSN changes to.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per FSN change (ConceptId, BeforeEffectiveTime, BeforeFSN,
+        AfterEffectiveTime, AfterFSN).
     """
     if not is_ci():
         print("Detecting FSN changes...")
@@ -121,70 +122,26 @@ def detect_fsn_changes(
     active_concepts = load_active_concepts(concept_snapshot_file)
     spinner.succeed(f"Loaded {len(active_concepts)} active concepts.")
 
-    # Read the full description file into memory
-    spinner.start("Loading full description history...")
-    concept_history = load_full_description_history(full_description_file)
-    spinner.succeed(f"Loaded {len(concept_history)} concepts with full description history.")
+    # Stream the full description file, keeping active FSNs of active concepts
+    spinner.start("Loading FSN history of active concepts...")
+    fsn_df = load_active_fsn_history(full_description_file, active_concepts)
+    spinner.succeed(f"Loaded {len(fsn_df)} active FSN rows.")
 
-    # Filter and process concepts with FSN changes
-    changed_concepts = {}
     spinner.start("Detecting FSN changes...")
-    for conceptId, records in concept_history.items():
-        if conceptId not in active_concepts:
-            continue
-
-        # Filter to FSN rows only (typeId == FSN_TYPE_ID)
-        fsn_records = [r for r in records if r["typeId"] == FSN_TYPE_ID]
-        if not fsn_records:
-            continue
-
-        # Among those, consider only rows that are active=1
-        active_fsn_records = [r for r in fsn_records if r["active"] == "1"]
-        if not active_fsn_records:
-            continue
-
-        # Sort active FSN records by effectiveTime (ascending)
-        active_fsn_records.sort(key=lambda x: x["effectiveTime"])
-
-        # Deduplicate snapshots by FSN text (term)
-        snapshots = []
-        last_term = None
-        for r in active_fsn_records:
-            if r["term"] != last_term:
-                snapshots.append(
-                    (r["effectiveTime"], r["descriptionId"], r["term"])
-                )
-                last_term = r["term"]
-
-        if len(snapshots) > 1:
-            changed_concepts[conceptId] = snapshots
-    spinner.succeed(f"Detected {len(changed_concepts)} concepts with FSN changes.")
+    df = find_fsn_changes(fsn_df)
+    spinner.succeed(f"Detected {df['ConceptId'].nunique()} concepts with FSN changes.")
 
     # Print the results and export
-    if not changed_concepts:
+    if df.empty:
         print("No FSN changes found across the full history.")
-    else:
+    elif output_path:
         spinner.start("Collecting FSN changes...")
-        data = []
-        for conceptId, snapshots in sorted(changed_concepts.items(), key=lambda x: x[0]):
-            for i in range(len(snapshots) - 1):
-                before = snapshots[i]
-                after = snapshots[i + 1]
-                data.append([
-                    conceptId,
-                    before[0],  # BeforeEffectiveTime
-                    before[2],  # BeforeFSN
-                    after[0],   # AfterEffectiveTime
-                    after[2]    # AfterFSN
-                ])
-
-        df = pd.DataFrame(
-            data,
-            columns=["ConceptId", "BeforeEffectiveTime", "BeforeFSN", "AfterEffectiveTime", "AfterFSN"]
-        )
-        df.to_excel(output_path, index=False)
+        # Excel stores numbers as doubles, so SCTIDs (up to 18 digits) are written as text
+        df.astype({'ConceptId': str}).to_excel(output_path, index=False)
         spinner.succeed(f"FSN changes have been exported to {output_path}")
 
+    return df
+
 
 def main():
     """
@@ -0,0 +1,91 @@
+"""
+Compact conceptId -> FSN lookup built once per run from the Snapshot
+description file and shared by the detectors.
+"""
+import re
+import numpy as np
+import pandas as pd
+from rf2_loader import load_rf2, FSN_TYPE_ID
+
+SEMANTIC_TAG_PATTERN = re.compile(r'\(([^()]*)\)$')
+
+
+class FSNLookup:
+    """
+    Active FSNs stored as sorted int64 conceptIds plus offsets into a single
+    UTF-8 buffer, instead of one Python string per concept. Lookups are a
+    binary search (np.searchsorted) over the ids.
+    """
+
+    def __init__(self, concept_ids, terms):
+        concept_ids = np.asarray(concept_ids, dtype=np.int64)
+        order = np.argsort(concept_ids, kind="stable")
+        encoded = [terms[i].encode("utf-8") for i in order]
+
+        self.ids = concept_ids[order]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=self.offsets[1:])
+        self.buffer = b"".join(encoded)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, concept_id):
+        return self._position(concept_id) is not None
+
+    def _position(self, concept_id):
+        pos = np.searchsorted(self.ids, concept_id)
+        if pos < len(self.ids) and self.ids[pos] == concept_id:
+            return pos
+        return None
+
+    def _term_at(self, pos):
+        return self.buffer[self.offsets[pos]:self.offsets[pos + 1]].decode("utf-8")
+
+    def get(self, concept_id, default=None):
+        """FSN of a concept, or default if it has no active FSN."""
+        pos = self._position(concept_id)
+        return default if pos is None else self._term_at(pos)
+
+    def semantic_tag(self, concept_id, default=None):
+        """Semantic tag of a concept's FSN, e.g. 'disorder'."""
+        match = SEMANTIC_TAG_PATTERN.search(self.get(concept_id, ""))
+        return match.group(1) if match else default
+
+    def terms(self, concept_ids):
+        """
+        Vectorized get(): returns an object array of FSNs aligned with
+        concept_ids, with NaN where a concept has no active FSN (the same
+        result as a left merge with an FSN table).
+        """
+        concept_ids = np.asarray(concept_ids)
+        result = np.full(len(concept_ids), np.nan, dtype=object)
+        if not len(self.ids) or not len(concept_ids):
+            return result
+
+        # Missing values (e.g. from nullable id columns) never match
+        valid = ~pd.isna(concept_ids)
+        wanted = concept_ids[valid].astype(np.int64)
+        pos = np.searchsorted(self.ids, wanted).clip(max=len(self.ids) - 1)
+        found = self.ids[pos] == wanted
+
+        target = np.flatnonzero(valid)[found]
+        result[target] = [self._term_at(p) for p in pos[found]]
+        return result
+
+
+def build_fsn_lookup(description_snapshot_path) -> FSNLookup:
+    """
+    Builds the FSNLookup from a Snapshot description file (path, ZipMember or
+    cached table). Only active FSN rows are kept; if a concept has several,
+    the one with the latest effectiveTime wins.
+    """
+    desc_df = load_rf2(
+        description_snapshot_path,
+        "description",
+        columns=['conceptId', 'effectiveTime', 'active', 'typeId', 'term']
+    )
+    fsn_df = desc_df[(desc_df['typeId'] == FSN_TYPE_ID) & (desc_df['active'] == 1)]
+    fsn_df = fsn_df.sort_values('effectiveTime', kind='stable')
+    fsn_df = fsn_df.drop_duplicates('conceptId', keep='last')
+    return FSNLookup(fsn_df['conceptId'].to_numpy(), fsn_df['term'].to_numpy())
@@ -1,18 +1,29 @@
 #!/usr/bin/env python3
 
-import json
 import pandas as pd
-import plotly.graph_objects as go
 from halo import Halo
 import numpy as np
 from matplotlib import cm
 from tqdm import tqdm
-from ci_utils import is_ci, convert_numpy_types
+from ci_utils import is_ci
+from report_utils import (
+    bar_trace,
+    build_group_index,
+    cell_details,
+    prepare_columns,
+    stacked_bar_layout,
+    write_detail_shards,
+    write_report_html,
+    year_zoom_ranges,
+)
 
 def generate_new_concepts_report(
-    input_file="sct-changes-reports/list-new-concepts.xlsx",
+    input_data="sct-changes-reports/list-new-concepts.xlsx",
     output_html="sct-changes-reports/new_concepts_by_semantic_tag.html",
-    heads_size=500
+    heads_size=500,
+    details_dir=None,
+    details_url=None,
+    runtime_url=""
 ):
     """
     Generate an interactive Plotly HTML chart showing new concepts by creation date
@@ -20,14 +31,24 @@ def generate_new_concepts_report(
     
     Parameters
     ----------
-    input_file : str
-        Path to the Excel file containing new concept data (with columns like 'conceptId', 
-        'creationEffectiveTime', 'FSN').
+    input_data : pd.DataFrame or str
+        DataFrame returned by detect_new_concepts, or path to the Excel file containing
+        new concept data (with columns like 'conceptId', 'creationEffectiveTime', 'FSN').
     output_html : str
         Path to the output HTML file where the interactive chart will be saved.
     heads_size : int
         Maximum number of example rows to display in the details pop-up when clicking a bar.
         Defaults to 500.
+    details_dir : str, optional
+        If given, the example rows of each bar segment are written as separate JSON files
+        to this directory and fetched when the bar is clicked, instead of being embedded
+        in the HTML.
+    details_url : str, optional
+        URL the page uses to fetch files from details_dir. Defaults to the directory name,
+        relative to the HTML file.
+    runtime_url : str, optional
+        URL prefix the page uses to load report-runtime.js/.css, which are copied next
+        to output_html. Defaults to the HTML file's directory.
     """
     if not is_ci():
         print(f"Generating new concepts report...")
@@ -37,7 +58,10 @@ def generate_new_concepts_report(
     # -------------------------------------------------------------------------
     # 1. Load the dataset
     # -------------------------------------------------------------------------
-    df = pd.read_excel(input_file)
+    if isinstance(input_data, pd.DataFrame):
+        df = input_data.copy()
+    else:
+        df = pd.read_excel(input_data)
     spinner.succeed("Dataset loaded successfully.")
 
     spinner.start("Ensuring FSN is a string...")
@@ -70,42 +94,48 @@ def generate_new_concepts_report(
     # -------------------------------------------------------------------------
     spinner.start("Grouping data by creationEffectiveTime and semanticTag...")
     grouped = df.groupby(["creationEffectiveTime", "semanticTag"], observed=False).size().unstack(fill_value=0)
+    group_index = build_group_index(df, "creationEffectiveTime", "semanticTag")
+    example_columns = prepare_columns(df)
     spinner.succeed("Data grouped.")
 
-    # Prepare data for Plotly
-    fig = go.Figure()
+    detail_urls = None
+    if details_dir:
+        spinner.start(f"Writing detail files to {details_dir}...")
+        detail_urls = write_detail_shards(
+            example_columns, group_index, grouped.index, grouped.columns, heads_size, details_dir, details_url
+        )
+        spinner.succeed(f"{len(detail_urls)} detail files written.")
 
     # Calculate total counts for each creationEffectiveTime
     total_counts = grouped.sum(axis=1)
+    times = grouped.index.tolist()
 
     # -------------------------------------------------------------------------
-    # 5. Add stacked bar traces
+    # 5. Stacked bar traces (plain dicts, generated one at a time while the
+    #    HTML is written)
     # -------------------------------------------------------------------------
-    for tag in tqdm(grouped.columns, desc="Processing Semantic Tags", unit="tag", disable=is_ci()):
-        fig.add_trace(
-            go.Bar(
-                x=grouped.index.tolist(),
-                y=grouped[tag].values,
-                name=tag,
-                customdata=[
+    def traces():
+        for tag in tqdm(grouped.columns, desc="Processing Semantic Tags", unit="tag", disable=is_ci()):
+            yield bar_trace(
+                tag,
+                times,
+                grouped[tag].to_numpy(),
+                [
                     {
                         "SemanticTag": tag,
                         "TotalCount": total_counts[time],
-                        "Examples": df[
-                            (df["creationEffectiveTime"] == time) & (df["semanticTag"] == tag)
-                        ].head(heads_size).to_dict('records'),
+                        **cell_details(example_columns, group_index, time, tag, heads_size, detail_urls),
                         "heads_size": heads_size
                     }
                     for time in grouped.index
                 ],
-                hovertemplate=(
+                (
                     "<b>Semantic Tag:</b> %{customdata.SemanticTag}<br>"
                     "<b>Count:</b> %{y}<br>"
                     "<b>Creation Time:</b> %{x}<br>"
                     "<b>Total Count:</b> %{customdata.TotalCount}<extra></extra>"
                 ),
             )
-        )
 
     # -------------------------------------------------------------------------
     # 6. Configure layout
@@ -120,227 +150,33 @@ def generate_new_concepts_report(
         for r, g, b, _ in continuous_palette
     ]
 
-    fig.update_layout(
-        colorway=continuous_palette,
+    layout = stacked_bar_layout(
         title="New Concepts by Creation Date and Semantic Tag",
         xaxis_title="Creation Effective Time",
         yaxis_title="Count of New Concepts",
-        barmode="stack",
         legend_title="Semantic Tag",
-        xaxis=dict(type="category", tickangle=45),
+        colorway=continuous_palette,
         height=600,
     )
     spinner.succeed("Layout configured.")
 
     # -------------------------------------------------------------------------
-    # 7. Generate JSON for the Plotly figure
-    # -------------------------------------------------------------------------
-    spinner.start("Generating Plotly JSON...")
-    # Use json.dumps to ensure arrays are serialized as JSON arrays, not binary format
-    # Convert NumPy types to native Python types for JSON serialization
-    fig_dict = convert_numpy_types(fig.to_dict())
-    fig_json = json.dumps(fig_dict)
-    spinner.succeed("Plotly JSON generated.")
-
-    # -------------------------------------------------------------------------
-    # 8. Create an HTML template for interactive display (no backticks!)
+    # 7. Options of the shared report runtime (report-runtime.js)
     # -------------------------------------------------------------------------
-    html_template = """
-<html>
-<head>
-    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;500&display=swap');
-        body {
-            font-family: 'Roboto', sans-serif;
-        }
-        .hover-row {
-            transition: background-color 0.2s;
-        }
-        .hover-row:hover {
-            background-color: #dbdbdb;
-        }
-    </style>
-</head>
-<body>
-    <div id="year-buttons"></div>
-    <div id="chart" style="width:100%;height:80%;"></div>
-    <div id="details" style="margin-top:10px;border:1px solid black;padding:10px;">
-        <h3 id="details-title">Details</h3>
-        <div id="details-content">Click on a bar to see details here.</div>
-    </div>
-    <script>
-        var data = REPLACE_ME_WITH_JSON;
-        Plotly.newPlot('chart', data.data, data.layout);
-
-        function zoomToYear(year) {
-            var chart = document.getElementById('chart');
-            if (!data || !data.data || !data.data[0] || !data.data[0].x) {
-                console.error("Error: Data is not properly defined.");
-                alert("Chart data is unavailable.");
-                return;
-            }
-            var xData = data.data[0].x;
-            var yearStr = year.toString();
-            var filteredDates = xData.filter(function(date) {
-                return date.startsWith(yearStr);
-            });
-            if (filteredDates.length === 0) {
-                alert("No data available for " + year);
-                return;
-            }
-            filteredDates.sort();
-            var minDate = filteredDates[0];
-            var maxDate = filteredDates[filteredDates.length - 1];
-            var idxMin = xData.indexOf(minDate);
-            var idxMax = xData.lastIndexOf(maxDate);
-            if (idxMin === -1 || idxMax === -1) {
-                console.error("Error: Unable to find indices for " + minDate + " - " + maxDate);
-                alert("Unexpected error zooming to " + year);
-                return;
-            }
-            var rangeMin = Math.max(0, idxMin - 0.5);
-            var rangeMax = idxMax + 0.5;
-
-            var summedYValues = Array(xData.length).fill(0);
-            data.data.forEach(function(trace) {
-                if (trace.y && trace.x) {
-                    trace.y.forEach(function(yValue, index) {
-                        if (!isNaN(yValue) && yValue !== undefined) {
-                            summedYValues[index] += yValue;
-                        }
-                    });
-                }
-            });
-            var maxY = Math.max.apply(null, summedYValues.slice(idxMin, idxMax + 1));
-            Plotly.relayout(chart, {
-                "xaxis.type": "category",
-                "xaxis.range": [rangeMin, rangeMax],
-                "yaxis.range": [0, maxY * 1.1]
-            }).then(function() {
-                attachPlotlyClickHandler();
-            });
-        }
-
-        function attachPlotlyClickHandler() {
-            var chart = document.getElementById('chart');
-            if (!chart) {
-                console.error("Error: Chart element not found.");
-                return;
-            }
-            if (chart.removeAllListeners) {
-                chart.removeAllListeners('plotly_click');
-            }
-            chart.on('plotly_click', function(evt) {
-                var detailsDiv = document.getElementById('details-content');
-                var titleDiv = document.getElementById('details-title');
-                var point = evt.points[0];
-                var examples = point.customdata.Examples;
-
-                if (point.y > point.customdata.heads_size) {
-                    titleDiv.textContent = "Details for " + point.customdata.SemanticTag + 
-                        " - " + point.x + 
-                        " (first " + point.customdata.heads_size + 
-                        " rows of " + point.y + ")";
-                } else {
-                    titleDiv.textContent = "Details for " + point.customdata.SemanticTag + 
-                        " - " + point.x + 
-                        " (all " + point.y + " rows)";
-                }
-
-                if (examples && examples.length > 0) {
-                    var detailsHtml = "<table style=\\"border-collapse: collapse; width: 100%;\\">" +
-                        "<thead>" +
-                            "<tr>" +
-                                "<th style=\\"border: 1px solid #000; padding: 8px;\\">ConceptId</th>" +
-                                "<th style=\\"border: 1px solid #000; padding: 8px;\\">FSN</th>" +
-                            "</tr>" +
-                        "</thead>" +
-                        "<tbody>";
-                    examples.forEach(function(example) {
-                        detailsHtml += 
-                            "<tr class=\\"hover-row\\">" +
-                                "<td style=\\"border: 1px solid #000; padding: 8px;\\">" + example.conceptId + "</td>" +
-                                "<td style=\\"border: 1px solid #000; padding: 8px;\\">" + example.FSN + "</td>" +
-                            "</tr>";
-                    });
-                    detailsHtml += "</tbody></table>";
-                    detailsDiv.innerHTML = detailsHtml;
-                } else {
-                    detailsDiv.innerHTML = "No examples available.";
-                }
-            });
-        }
-
-        function generateYearButtons() {
-            if (!data || !data.data || !data.data[0] || !data.data[0].x) {
-                console.error("Error: Data is not properly defined.");
-                return;
-            }
-            var xData = data.data[0].x;
-            var years = Array.from(new Set(xData.map(function(date) {
-                return date.substring(0, 4);
-            })))
-            .filter(function(year) {
-                return parseInt(year) > 2021;
-            })
-            .sort();
-
-            var container = document.getElementById('year-buttons');
-            container.innerHTML = "";
-
-            var zoomSpan = document.createElement("span");
-            zoomSpan.textContent = "Zoom: ";
-            container.appendChild(zoomSpan);
-
-            var resetButton = document.createElement("button");
-            resetButton.textContent = "Reset";
-            resetButton.style.marginRight = "10px";
-            resetButton.onclick = resetZoom;
-            container.appendChild(resetButton);
-
-            years.forEach(function(year) {
-                var button = document.createElement("button");
-                // Instead of using backticks, just convert the year to string
-                button.textContent = String(year);
-                button.style.marginRight = "5px";
-                button.onclick = function() {
-                    zoomToYear(year);
-                };
-                container.appendChild(button);
-            });
-        }
-
-        function resetZoom() {
-            var chart = document.getElementById('chart');
-            if (!data || !data.layout || !data.data) {
-                console.error("Error: Data is not properly defined.");
-                alert("Chart data is unavailable.");
-                return;
-            }
-            Plotly.relayout(chart, {
-                "xaxis.autorange": true,
-                "yaxis.autorange": true
-            }).then(function() {
-                attachPlotlyClickHandler();
-            });
-        }
-
-        setTimeout(generateYearButtons, 100);
-        setTimeout(attachPlotlyClickHandler, 100);
-    </script>
-</body>
-</html>
-"""
+    options = {
+        "categoryKey": "SemanticTag",
+        "columns": [
+            {"field": "conceptId", "header": "ConceptId"},
+            {"field": "FSN", "header": "FSN"},
+        ],
+        "zoomYears": year_zoom_ranges(times, total_counts, 2022),
+    }
 
     # -------------------------------------------------------------------------
-    # 9. Insert the Plotly JSON and write out the final HTML
+    # 8. Stream the Plotly figure JSON into the final HTML
     # -------------------------------------------------------------------------
     spinner.start(f"Writing final HTML to {output_html}...")
-    html_output = html_template.replace("REPLACE_ME_WITH_JSON", fig_json)
-
-    with open(output_html, "w", encoding="utf-8") as f:
-        f.write(html_output)
+    write_report_html(traces(), layout, options, output_html, runtime_url)
 
     spinner.succeed(f"HTML file with interactive chart created: {output_html}")
 
@@ -0,0 +1,68 @@
+"""
+Precompressed copies (.gz, .br) of the generated report assets, so static
+hosting can serve compressed bytes without compressing on every request.
+"""
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from ci_utils import log
+
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz files are written
+    brotli = None
+
+
+def _gzip(data):
+    # mtime=0 keeps the output identical for identical input, so unchanged
+    # reports do not show up as changed files in git
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def available_encodings():
+    """{suffix: compress function} for the encodings available here."""
+    encodings = {".gz": _gzip}
+    if brotli is not None:
+        encodings[".br"] = _brotli
+    return encodings
+
+
+def _compress_to(path, suffix, compress):
+    with open(path, "rb") as f:
+        data = f.read()
+    target = path + suffix
+    tmp_path = target + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(compress(data))
+    os.replace(tmp_path, target)
+    return target
+
+
+def precompress_files(paths, max_workers=None):
+    """
+    Writes <path>.gz and, if the brotli package is installed, <path>.br next to
+    every file in paths, at maximum compression. The files are compressed in
+    parallel (zlib and brotli release the GIL). A stale .br from an earlier run
+    is removed when brotli is not available.
+
+    Returns the list of written files.
+    """
+    encodings = available_encodings()
+    if brotli is None:
+        log("brotli is not installed; writing .gz files only")
+        for path in paths:
+            if os.path.exists(path + ".br"):
+                os.remove(path + ".br")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_compress_to, path, suffix, compress)
+            for path in paths
+            for suffix, compress in encodings.items()
+        ]
+        return [future.result() for future in futures]
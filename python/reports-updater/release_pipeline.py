@@ -0,0 +1,277 @@
+"""
+Download-to-cache pipeline for a release ZIP. The end of the ZIP (its central
+directory) is requested first, the rest is then downloaded into a preallocated
+spool file, and each needed member is handed to a worker thread as soon as all
+of its bytes are on disk. Downloading, decompressing and parsing overlap
+instead of running one after the other.
+"""
+import bisect
+import os
+import struct
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from tqdm import tqdm
+
+from ci_utils import is_ci, log
+from download_and_extract import (
+    DOWNLOAD_CHUNK_MB,
+    DOWNLOAD_CONNECTIONS,
+    REQUEST_TIMEOUT,
+    check_authentication,
+    download_ranges,
+    download_snomed,
+    download_with_retries,
+    mlds_session,
+    parse_content_range,
+    strong_etag,
+    verify_download,
+)
+from file_locator import ZipRelease
+
+# Bytes requested from the end of the ZIP, enough for the central directory of
+# the International release (a few hundred KB); more is fetched if needed
+TAIL_BYTES = 1024 * 1024
+# Members processed at the same time; each parsed RF2 table is held in memory
+PROCESS_WORKERS = 2
+
+_EOCD_SIGNATURE = b"PK\x05\x06"
+_ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+
+
+class _RangeNotSupported(Exception):
+    pass
+
+
+class SpoolFile:
+    """
+    Preallocated file filled from the start by one download thread, while
+    other threads wait until the byte range they need is written.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        with open(path, "wb") as f:
+            f.truncate(size)
+        self._written = 0
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def write_at(self, offset, data):
+        with open(self.path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+
+    def advance(self, written):
+        """The first written bytes are on disk."""
+        with self._condition:
+            self._written = written
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        """The download is complete, or failed with error."""
+        with self._condition:
+            self._done = True
+            self._error = error
+            if error is None:
+                self._written = self.size
+            self._condition.notify_all()
+
+    def wait_until(self, end):
+        """Blocks until bytes [0, end) are on disk; raises if the download failed."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._written >= end or self._done)
+            if self._error is not None:
+                raise RuntimeError(f"Download of {self.path} failed: {self._error}") from self._error
+
+
+def stream_release(url, output_dir, select, process, expected_size=None, expected_sha256=None,
+                   max_workers=PROCESS_WORKERS, chunk_size_mb=None, max_retries=None, connections=None):
+    """
+    Downloads the release ZIP at url to output_dir/snomed_release.zip and
+    processes some of its members while the rest is still downloading.
+
+    select(release) gets a file_locator.ZipRelease as soon as the central
+    directory is known and returns {member name: key} of the members to
+    process. process(member, key) is then called in a worker thread with the
+    file_locator.ZipMember of each of them, once its bytes are downloaded;
+    reading a member checks its CRC-32. Returns {key: process result}.
+
+    Dropped connections are resumed as in download_snomed (same retry and
+    connections settings; with several connections the members still become
+    available in file order), and the complete ZIP is checked against
+    expected_size / expected_sha256. That check runs after the members are
+    processed, so process should write its results somewhere they can be
+    discarded until stream_release returns (it raises if the check fails).
+    If the server does not serve byte ranges, the ZIP is downloaded with
+    download_snomed first and the members processed afterwards.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    zip_path = os.path.join(output_dir, "snomed_release.zip")
+    chunk_size = int((chunk_size_mb or DOWNLOAD_CHUNK_MB) * 1024 * 1024)
+    connections = connections or DOWNLOAD_CONNECTIONS
+    session = mlds_session(connections)
+
+    try:
+        total_size, tail_offset, tail, etag = download_with_retries(
+            lambda: _fetch_tail(session, url), lambda: 0, max_retries
+        )
+    except _RangeNotSupported:
+        log("⚠ Server does not support Range requests; processing after the download")
+        zip_path = download_snomed(url, output_dir, expected_size, expected_sha256, chunk_size_mb, max_retries,
+                                   connections=1)
+        release = ZipRelease(zip_path)
+        selected = _check_selection(release, select(release))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {key: pool.submit(process, release.member(name), key) for name, key in selected.items()}
+            return {key: future.result() for key, future in futures.items()}
+
+    if expected_size and total_size != expected_size:
+        raise RuntimeError(f"Server file has {total_size} bytes, expected {expected_size}")
+
+    spool = SpoolFile(zip_path, total_size)
+    spool.write_at(tail_offset, tail)
+    release = ZipRelease(zip_path)
+    selected = _check_selection(release, select(release))
+    ends = _member_ends(zip_path, selected, tail_offset)
+    log(f"📦 Central directory read; {len(selected)} members are processed as they arrive")
+
+    def download_body():
+        try:
+            _download_body(session, url, spool, tail_offset, etag, chunk_size, max_retries, connections)
+            spool.finish()
+        except BaseException as e:
+            spool.finish(e)
+
+    downloader = threading.Thread(target=download_body, name="release-download", daemon=True)
+    downloader.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            for name in sorted(selected, key=ends.get):
+                spool.wait_until(ends[name])
+                futures[selected[name]] = pool.submit(process, release.member(name), selected[name])
+            spool.wait_until(total_size)
+            results = {key: future.result() for key, future in futures.items()}
+    finally:
+        downloader.join()
+
+    verify_download(zip_path, total_size, expected_sha256)
+    if not is_ci():
+        print(f"✓ Downloaded {total_size / (1024*1024):.1f} MB")
+    return results
+
+
+def _check_selection(release, selected):
+    missing = [name for name in selected if name not in release.members]
+    if missing:
+        raise FileNotFoundError(f"RF2 files not found in {release.zip_path}: {', '.join(missing)}")
+    return selected
+
+
+def _fetch_tail(session, url):
+    """
+    Requests the end of the ZIP, down to the start of its central directory.
+    Returns (total size, offset of the returned bytes, bytes, ETag).
+    """
+    with session.get(url, stream=True, headers={"Range": f"bytes=-{TAIL_BYTES}"}, timeout=REQUEST_TIMEOUT) as r:
+        check_authentication(r, session.auth[0], url)
+        r.raise_for_status()
+        tail_offset, total_size = parse_content_range(r.headers.get("content-range"))
+        if r.status_code != 206 or tail_offset is None or total_size is None:
+            raise _RangeNotSupported()
+        tail = r.content
+        etag = strong_etag(r)
+
+    directory_offset = _central_directory_offset(tail, tail_offset)
+    if directory_offset < tail_offset:
+        headers = {"Range": f"bytes={directory_offset}-{tail_offset - 1}"}
+        if etag:
+            headers["If-Range"] = etag
+        with session.get(url, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise requests.ConnectionError("ZIP changed on the server while reading its central directory")
+            tail = r.content + tail
+        tail_offset = directory_offset
+    return total_size, tail_offset, tail, etag
+
+
+def _central_directory_offset(tail, tail_offset):
+    """Offset of the central directory, from the (ZIP64) end of central directory record in tail."""
+    eocd = tail.rfind(_EOCD_SIGNATURE)
+    if eocd < 0:
+        raise zipfile.BadZipFile("End of central directory record not found")
+    directory_offset = struct.unpack("<L", tail[eocd + 16:eocd + 20])[0]
+    locator = eocd - 20
+    if directory_offset == 0xFFFFFFFF and tail[locator:locator + 4] == _ZIP64_LOCATOR_SIGNATURE:
+        record = struct.unpack("<Q", tail[locator + 8:locator + 16])[0] - tail_offset
+        directory_offset = struct.unpack("<Q", tail[record + 48:record + 56])[0]
+    return directory_offset
+
+
+def _member_ends(zip_path, names, directory_offset):
+    """
+    {name: offset where the member's data ends}: the local header of the next
+    member in the file, or the central directory for the last one.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        infos = {info.filename: info for info in zip_ref.infolist()}
+    starts = sorted(info.header_offset for info in infos.values())
+    ends = {}
+    for name in names:
+        i = bisect.bisect_right(starts, infos[name].header_offset)
+        ends[name] = starts[i] if i < len(starts) else directory_offset
+    return ends
+
+
+def _download_body(session, url, spool, end, etag, chunk_size, max_retries, connections=1):
+    """
+    Downloads bytes [0, end) into spool, resuming after dropped connections:
+    in order over one connection, or with download_ranges over several.
+    """
+    position = 0
+    if end == 0:
+        # The whole ZIP came with the central directory
+        return
+
+    def attempt():
+        nonlocal position
+        headers = {"Range": f"bytes={position}-{end - 1}"}
+        if etag:
+            headers["If-Range"] = etag
+        with session.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+            check_authentication(r, session.auth[0], url)
+            r.raise_for_status()
+            if r.status_code != 206 or parse_content_range(r.headers.get("content-range"))[0] != position:
+                raise RuntimeError("ZIP changed on the server during the download")
+            with open(spool.path, "r+b") as f:
+                f.seek(position)
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    f.flush()
+                    position += len(chunk)
+                    spool.advance(position)
+                    pbar.update(len(chunk))
+        if position < end:
+            raise requests.ConnectionError(f"Connection closed after {position} of {end} bytes")
+
+    # Download with progress bar (disabled in CI)
+    with tqdm(
+        total=end,
+        unit='B',
+        unit_scale=True,
+        unit_divisor=1024,
+        desc="Download progress",
+        disable=is_ci()
+    ) as pbar:
+        if connections > 1:
+            log(f"📦 Downloading over {connections} connections")
+            download_ranges(session, url, spool.path, 0, end, connections, chunk_size, max_retries,
+                            etag, spool.advance, pbar)
+        else:
+            download_with_retries(attempt, lambda: position, max_retries)
@@ -0,0 +1,106 @@
+"""
+Persistent record of the processed SNOMED releases (release-registry.json,
+committed with the reports), so a run can skip the download and the report
+generation when neither the release nor the report code changed since the last one.
+
+    {
+      "releases": {
+        "<content version>": {
+          "title": ..., "edition": ..., "release_date": ..., "processed_at": ...,
+          "generator": "<generator_fingerprint()>",
+          "artifacts": ["../../src/assets/reports/...", ...]
+        }
+      }
+    }
+"""
+import glob
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_PATH = os.path.join(MODULE_DIR, "release-registry.json")
+
+
+def load_registry(path=REGISTRY_PATH):
+    """Returns the registry stored at path, or an empty one if there is none."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            registry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        registry = {}
+    registry.setdefault("releases", {})
+    # Single-edition registries also pointed at their last release
+    registry.pop("latest", None)
+    return registry
+
+
+def save_registry(registry, path=REGISTRY_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def release_key(release):
+    """Registry key of a feed entry (syndication_downloader): its content version."""
+    return release.get("content_version") or release["zip_url"]
+
+
+# Scripts next to the report code that do not affect the reports
+NON_REPORT_SCRIPTS = ("test_*.py", "benchmark_*.py", "debug_*.py")
+
+
+def generator_fingerprint():
+    """
+    SHA-256 over the report code (the *.py modules except NON_REPORT_SCRIPTS,
+    and report_runtime/), so reports generated by older code are not taken as
+    up to date.
+    """
+    excluded = {
+        path for pattern in NON_REPORT_SCRIPTS for path in glob.glob(os.path.join(MODULE_DIR, pattern))
+    }
+    paths = sorted(
+        [path for path in glob.glob(os.path.join(MODULE_DIR, "*.py")) if path not in excluded]
+        + glob.glob(os.path.join(MODULE_DIR, "report_runtime", "*"))
+    )
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, MODULE_DIR).replace(os.sep, "/").encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def is_up_to_date(registry, key, fingerprint, path=REGISTRY_PATH):
+    """
+    True if release key was processed with the current report code
+    (fingerprint) and all of its recorded artifacts still exist.
+    """
+    entry = registry["releases"].get(key)
+    if not entry or entry.get("generator") != fingerprint:
+        return False
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return all(os.path.exists(os.path.join(base_dir, artifact)) for artifact in entry.get("artifacts", []))
+
+
+def record_release(registry, release, fingerprint, artifacts, path=REGISTRY_PATH):
+    """
+    Records release (a feed entry) as processed, with the files and folders it
+    produced. Artifact paths are stored relative to the registry file.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    key = release_key(release)
+    registry["releases"][key] = {
+        "title": release.get("title"),
+        "edition": release.get("edition"),
+        "release_date": release.get("release_date"),
+        "processed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "generator": fingerprint,
+        "artifacts": sorted(
+            os.path.relpath(os.path.abspath(artifact), base_dir).replace(os.sep, "/")
+            for artifact in artifacts
+        ),
+    }
@@ -0,0 +1,303 @@
+/*
+ * Shared runtime of the SNOMED CT change reports generated by
+ * python/reports-updater (see report_utils.write_report_html).
+ *
+ * Each report page pushes its configuration onto window.sctReports:
+ *
+ *     (window.sctReports = window.sctReports || []).push({options: {...}, figure: {...}});
+ *
+ * This script renders every queued report and afterwards renders new pushes
+ * right away. The queue is needed because the Angular report pages inject the
+ * report HTML and re-create its <script> tags, so this file may finish loading
+ * after the inline report script has already run.
+ */
+(function() {
+    var queued = window.sctReports;
+    if (queued && queued.isRuntime) {
+        // Already loaded by an earlier report page
+        return;
+    }
+
+    function decodeExamples(payload) {
+        // Columnar, dictionary-encoded rows (report_utils.encode_rows) -> row objects
+        if (!payload || Array.isArray(payload)) {
+            return payload;
+        }
+        var rows = [];
+        for (var i = 0; i < payload.length; i++) {
+            rows.push({});
+        }
+        Object.keys(payload.columns).forEach(function(name) {
+            var column = payload.columns[name];
+            for (var i = 0; i < payload.length; i++) {
+                if (Array.isArray(column)) {
+                    rows[i][name] = column[i];
+                } else {
+                    var code = column.codes ? column.codes[i] : 0;
+                    rows[i][name] = code < 0 ? null : column.dictionary[code];
+                }
+            }
+        });
+        return rows;
+    }
+
+    // Details table: rows are split into pages, and of the current page only the
+    // rows inside the scroll viewport (plus a few around it) are in the DOM.
+    var PAGE_SIZE = 100;
+    var VIEWPORT_HEIGHT = 600;  // px, max-height of .report-table-viewport
+    var ROW_HEIGHT = 37;        // px, assumed for rows that were not rendered yet
+    var OVERSCAN = 5;
+
+    function renderExamples(detailsDiv, examples, columns) {
+        var rows = decodeExamples(examples);
+        if (!rows || rows.length === 0) {
+            detailsDiv.innerHTML = "No examples available.";
+            return;
+        }
+        var pageCount = Math.ceil(rows.length / PAGE_SIZE);
+        var page = 0;
+        var heights = [];  // measured height of each rendered row
+        var scheduled = false;
+
+        function rowHeight(i) {
+            return heights[i] || ROW_HEIGHT;
+        }
+
+        function spacerRow(height) {
+            if (height <= 0) {
+                return "";
+            }
+            return "<tr class=\"report-table-spacer\"><td colspan=\"" + columns.length +
+                "\" style=\"height: " + height + "px\"></td></tr>";
+        }
+
+        detailsDiv.innerHTML = "";
+
+        var pager = document.createElement("div");
+        pager.className = "report-pager";
+        var previousButton = document.createElement("button");
+        previousButton.textContent = "Previous";
+        var pageLabel = document.createElement("span");
+        var nextButton = document.createElement("button");
+        nextButton.textContent = "Next";
+        pager.appendChild(previousButton);
+        pager.appendChild(pageLabel);
+        pager.appendChild(nextButton);
+
+        var viewport = document.createElement("div");
+        viewport.className = "report-table-viewport";
+        var headerHtml = "<thead><tr>";
+        columns.forEach(function(column) {
+            headerHtml += "<th>" + column.header + "</th>";
+        });
+        headerHtml += "</tr></thead>";
+        viewport.innerHTML = "<table class=\"report-table\">" + headerHtml + "<tbody></tbody></table>";
+        var tbody = viewport.querySelector("tbody");
+
+        function renderVisibleRows() {
+            scheduled = false;
+            var start = page * PAGE_SIZE;
+            var end = Math.min(rows.length, start + PAGE_SIZE);
+
+            // First row crossing the top of the viewport
+            var scrollTop = viewport.scrollTop;
+            var first = start;
+            var top = 0;
+            while (first < end - 1 && top + rowHeight(first) <= scrollTop) {
+                top += rowHeight(first);
+                first++;
+            }
+            // Rows up to the bottom of the viewport
+            var last = first;
+            var visibleHeight = 0;
+            while (last < end && visibleHeight < VIEWPORT_HEIGHT) {
+                visibleHeight += rowHeight(last);
+                last++;
+            }
+            for (var i = 0; i < OVERSCAN && first > start; i++) {
+                first--;
+                top -= rowHeight(first);
+            }
+            last = Math.min(end, last + OVERSCAN);
+            var bottom = 0;
+            for (var j = last; j < end; j++) {
+                bottom += rowHeight(j);
+            }
+
+            var bodyHtml = spacerRow(top);
+            for (var k = first; k < last; k++) {
+                bodyHtml += "<tr class=\"hover-row\">";
+                columns.forEach(function(column) {
+                    bodyHtml += "<td>" + rows[k][column.field] + "</td>";
+                });
+                bodyHtml += "</tr>";
+            }
+            bodyHtml += spacerRow(bottom);
+            tbody.innerHTML = bodyHtml;
+
+            var rendered = tbody.querySelectorAll("tr.hover-row");
+            for (var m = 0; m < rendered.length; m++) {
+                if (rendered[m].offsetHeight) {
+                    heights[first + m] = rendered[m].offsetHeight;
+                }
+            }
+        }
+
+        function showPage(newPage) {
+            page = Math.max(0, Math.min(pageCount - 1, newPage));
+            var start = page * PAGE_SIZE;
+            pageLabel.textContent = " Page " + (page + 1) + " of " + pageCount +
+                " (rows " + (start + 1) + "-" + Math.min(rows.length, start + PAGE_SIZE) +
+                " of " + rows.length + ") ";
+            previousButton.disabled = page === 0;
+            nextButton.disabled = page === pageCount - 1;
+            viewport.scrollTop = 0;
+            renderVisibleRows();
+        }
+
+        previousButton.onclick = function() {
+            showPage(page - 1);
+        };
+        nextButton.onclick = function() {
+            showPage(page + 1);
+        };
+        viewport.onscroll = function() {
+            if (!scheduled) {
+                scheduled = true;
+                window.requestAnimationFrame(renderVisibleRows);
+            }
+        };
+
+        if (pageCount > 1) {
+            detailsDiv.appendChild(pager);
+        }
+        detailsDiv.appendChild(viewport);
+        showPage(0);
+    }
+
+    function renderReport(config) {
+        if (!window.Plotly) {
+            // plotly.js is still loading
+            setTimeout(function() {
+                renderReport(config);
+            }, 50);
+            return;
+        }
+
+        var data = config.figure;
+        var options = config.options;
+        var chart = document.getElementById('chart');
+        var pendingDetailsUrl = null;
+
+        function showDetails(point) {
+            var detailsDiv = document.getElementById('details-content');
+            var titleDiv = document.getElementById('details-title');
+            var customdata = point.customdata;
+
+            if (point.y > customdata.heads_size) {
+                titleDiv.textContent = "Details for " + customdata[options.categoryKey] +
+                    " - " + point.x +
+                    " (first " + customdata.heads_size +
+                    " rows of " + point.y + ")";
+            } else {
+                titleDiv.textContent = "Details for " + customdata[options.categoryKey] +
+                    " - " + point.x +
+                    " (all " + point.y + " rows)";
+            }
+
+            // Details are either inline (Examples) or in a separate file (Details)
+            var detailsUrl = customdata.Details;
+            pendingDetailsUrl = detailsUrl;
+            if (!detailsUrl) {
+                renderExamples(detailsDiv, customdata.Examples, options.columns);
+                return;
+            }
+            detailsDiv.innerHTML = "Loading details...";
+            fetch(detailsUrl)
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error("HTTP " + response.status);
+                    }
+                    return response.json();
+                })
+                .then(function(examples) {
+                    // Ignore responses for a bar that is no longer selected
+                    if (pendingDetailsUrl === detailsUrl) {
+                        renderExamples(detailsDiv, examples, options.columns);
+                    }
+                })
+                .catch(function(error) {
+                    console.error("Error loading details from " + detailsUrl + ": " + error);
+                    if (pendingDetailsUrl === detailsUrl) {
+                        detailsDiv.innerHTML = "Details could not be loaded.";
+                    }
+                });
+        }
+
+        function attachPlotlyClickHandler() {
+            if (chart.removeAllListeners) {
+                chart.removeAllListeners('plotly_click');
+            }
+            chart.on('plotly_click', function(evt) {
+                showDetails(evt.points[0]);
+            });
+        }
+
+        function zoomToYear(year) {
+            // [first x index, last x index, highest stacked bar], from the generator
+            var range = options.zoomYears[year];
+            Plotly.relayout(chart, {
+                "xaxis.type": "category",
+                "xaxis.range": [Math.max(0, range[0] - 0.5), range[1] + 0.5],
+                "yaxis.range": [0, range[2] * 1.1]
+            }).then(attachPlotlyClickHandler);
+        }
+
+        function resetZoom() {
+            Plotly.relayout(chart, {
+                "xaxis.autorange": true,
+                "yaxis.autorange": true
+            }).then(attachPlotlyClickHandler);
+        }
+
+        function generateYearButtons() {
+            var years = Object.keys(options.zoomYears).sort();
+
+            var container = document.getElementById('year-buttons');
+            container.innerHTML = "";
+
+            var zoomSpan = document.createElement("span");
+            zoomSpan.textContent = "Zoom: ";
+            container.appendChild(zoomSpan);
+
+            var resetButton = document.createElement("button");
+            resetButton.textContent = "Reset";
+            resetButton.className = "reset-button";
+            resetButton.onclick = resetZoom;
+            container.appendChild(resetButton);
+
+            years.forEach(function(year) {
+                var button = document.createElement("button");
+                button.textContent = String(year);
+                button.className = "year-button";
+                button.onclick = function() {
+                    zoomToYear(year);
+                };
+                container.appendChild(button);
+            });
+        }
+
+        Plotly.newPlot(chart, data.data, data.layout).then(function() {
+            generateYearButtons();
+            attachPlotlyClickHandler();
+        });
+    }
+
+    window.sctReports = {
+        isRuntime: true,
+        push: function(config) {
+            renderReport(config);
+        }
+    };
+    (queued || []).forEach(renderReport);
+})();
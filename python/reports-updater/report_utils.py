@@ -0,0 +1,294 @@
+"""
+Helpers shared by the *_graph_details report generators.
+"""
+import glob
+import json
+import os
+import shutil
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+# Shared JS/CSS of the report pages, copied next to the generated HTML
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_runtime")
+RUNTIME_FILES = ("report-runtime.js", "report-runtime.css")
+
+# Report page: chart and details containers plus the report configuration,
+# rendered by report-runtime.js. The Angular report pages inject this HTML and
+# re-create its <script> tags, hence the window.sctReports queue.
+REPORT_PAGE = """<html>
+<head>
+    <meta charset="utf-8">
+    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
+    <link rel="stylesheet" href="RUNTIME_URLreport-runtime.css">
+    <script src="RUNTIME_URLreport-runtime.js"></script>
+</head>
+<body>
+    <div id="year-buttons"></div>
+    <div id="chart"></div>
+    <div id="details">
+        <h3 id="details-title">Details</h3>
+        <div id="details-content">Click on a bar to see details here.</div>
+    </div>
+    <script>
+        (window.sctReports = window.sctReports || []).push(REPORT_CONFIG);
+    </script>
+</body>
+</html>
+"""
+
+
+# SNOMED CT identifier columns of the report data. Extension SCTIDs have up to
+# 18 digits, more than a JavaScript number holds exactly, so they are sent as text
+SCTID_COLUMNS = {
+    "conceptId",
+    "ConceptId",
+    "inactivationReasonId",
+    "referencedComponentId",
+    "targetComponentId",
+}
+
+
+def build_group_index(df, time_col, category_col):
+    """
+    Maps every (time, category) cell of a report to the positional indices of
+    its rows in df, in df order, with a single groupby pass. Cells with no
+    rows are absent.
+    """
+    return df.groupby([time_col, category_col], observed=True, sort=False).indices
+
+
+def prepare_columns(df):
+    """
+    Per-column arrays of df for encode_rows, computed once for the whole frame:
+    (name, values, None) for numeric columns, with None for missing values, and
+    (name, pd.factorize codes, distinct values) for text columns. The distinct
+    values array has one extra None at the end, so code -1 (missing) maps to it.
+    Numeric SCTID_COLUMNS are converted to strings (in the values array).
+    """
+    prepared = []
+    for name in df.columns:
+        values = df[name]
+        if name in SCTID_COLUMNS and pd.api.types.is_numeric_dtype(values):
+            text = values.astype("Int64").astype("string")
+            prepared.append((name, text.astype(object).where(text.notna(), None).to_numpy(), None))
+        elif pd.api.types.is_numeric_dtype(values):
+            prepared.append((name, values.astype(object).where(values.notna(), None).to_numpy(), None))
+        else:
+            codes, uniques = pd.factorize(values)
+            dictionary = np.empty(len(uniques) + 1, dtype=object)
+            dictionary[:-1] = list(uniques)
+            prepared.append((name, codes, dictionary))
+    return prepared
+
+
+def encode_rows(prepared, rows):
+    """
+    Columnar, dictionary-encoded form of the given rows (positions or a slice)
+    of a prepare_columns() frame, decoded by the report templates (decodeExamples):
+
+        {"length": n, "columns": {name: values, ...}}
+
+    values is a plain list, or for text columns with repeated values (reasons,
+    semantic tags, times) {"dictionary": [distinct values], "codes": [index per
+    row, -1 for missing]}. A text column holding one value in every row (e.g.
+    the time of a single bar) is just {"dictionary": [value]}. Missing values
+    become null.
+    """
+    columns = {}
+    length = 0
+    for name, data, dictionary in prepared:
+        part = data[rows]
+        length = len(part)
+        if dictionary is None:
+            columns[name] = part.tolist()
+            continue
+
+        present = part >= 0
+        local_codes, used = pd.factorize(part[present])
+        if len(used) == 1 and length > 1 and present.all():
+            columns[name] = {"dictionary": dictionary[used].tolist()}
+        elif len(used) * 2 <= length:
+            codes = np.full(length, -1, dtype=np.intp)
+            codes[present] = local_codes
+            columns[name] = {"dictionary": dictionary[used].tolist(), "codes": codes.tolist()}
+        else:
+            columns[name] = dictionary[part].tolist()
+    return {"length": length, "columns": columns}
+
+
+def encode_columns(frame):
+    """encode_rows() of every row of frame."""
+    return encode_rows(prepare_columns(frame), slice(None))
+
+
+def group_examples(prepared, group_index, time, category, heads_size):
+    """
+    First heads_size rows of a (time, category) cell, encoded with encode_rows;
+    the same rows as df[(df[time_col] == time) & (df[category_col] == category)].head(heads_size),
+    where prepared is prepare_columns(df).
+    """
+    rows = group_index.get((time, category), [])
+    return encode_rows(prepared, np.asarray(rows[:heads_size], dtype=np.intp))
+
+
+def write_detail_shards(prepared, group_index, times, categories, heads_size, details_dir, details_url=None):
+    """
+    Writes the first heads_size rows of every non-empty (time, category) cell to
+    its own JSON file in details_dir, named <time>-<category position>.json.
+    Shards left over from a previous run are removed first.
+
+    Returns {(time, category): URL of the shard}, where the URL is details_url
+    (by default the name of details_dir, i.e. relative to the report HTML)
+    joined with the file name.
+    """
+    os.makedirs(details_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(details_dir, "*.json")):
+        os.remove(stale)
+
+    if details_url is None:
+        details_url = os.path.basename(os.path.normpath(details_dir))
+
+    urls = {}
+    for j, category in enumerate(categories):
+        for time in times:
+            if (time, category) not in group_index:
+                continue
+            payload = group_examples(prepared, group_index, time, category, heads_size)
+            filename = f"{time}-{j}.json"
+            with open(os.path.join(details_dir, filename), "w", encoding="utf-8") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            urls[(time, category)] = f"{details_url}/{filename}"
+    return urls
+
+
+def cell_details(prepared, group_index, time, category, heads_size, detail_urls=None):
+    """
+    customdata entry with the details of a bar segment: its examples inline, or
+    only the URL of its shard when detail_urls (from write_detail_shards) is given.
+    """
+    if detail_urls is None:
+        return {"Examples": group_examples(prepared, group_index, time, category, heads_size)}
+    return {"Details": detail_urls.get((time, category))}
+
+
+def _numpy_default(obj):
+    """json.dumps default= hook for NumPy scalars and arrays."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+@lru_cache(maxsize=None)
+def _default_template():
+    # The styling go.Figure would embed as layout.template
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+def bar_trace(name, x, y, customdata, hovertemplate):
+    """A Plotly bar trace as a plain dict, without go.Bar validation."""
+    return {
+        "type": "bar",
+        "name": name,
+        "x": x,
+        "y": y,
+        "customdata": customdata,
+        "hovertemplate": hovertemplate,
+    }
+
+
+def stacked_bar_layout(title, xaxis_title, yaxis_title, legend_title, colorway, height=None):
+    """
+    Layout of the stacked bar reports as a plain dict, as fig.update_layout
+    would build it (category x axis with 45 degree ticks).
+    """
+    layout = {
+        "colorway": list(colorway),
+        "title": {"text": title},
+        "xaxis": {"title": {"text": xaxis_title}, "type": "category", "tickangle": 45},
+        "yaxis": {"title": {"text": yaxis_title}},
+        "barmode": "stack",
+        "legend": {"title": {"text": legend_title}},
+    }
+    if height is not None:
+        layout["height"] = height
+    return layout
+
+
+def year_zoom_ranges(times, totals, first_year):
+    """
+    Zoom targets of the year buttons of a stacked bar report, for the years from
+    first_year on: {year: [first x index, last x index, highest stacked total]}.
+
+    times are the categories of the x axis (sorted YYYYMMDD values) and totals
+    the stacked height of each bar, so zooming to a year needs no scan of the
+    chart data in the browser.
+    """
+    years = np.array([str(time)[:4] for time in times])
+    totals = np.asarray(totals)
+    ranges = {}
+    for year in np.unique(years):
+        if int(year) < first_year:
+            continue
+        positions = np.flatnonzero(years == year)
+        first, last = int(positions[0]), int(positions[-1])
+        ranges[year] = [first, last, totals[first:last + 1].max().item()]
+    return ranges
+
+
+def install_report_runtime(assets_dir):
+    """
+    Copies the shared report runtime (report_runtime/report-runtime.js and .css)
+    into assets_dir, next to the report HTML files. Returns the copied paths.
+    """
+    os.makedirs(assets_dir, exist_ok=True)
+    copied = []
+    for filename in RUNTIME_FILES:
+        target = os.path.join(assets_dir, filename)
+        shutil.copyfile(os.path.join(RUNTIME_DIR, filename), target)
+        copied.append(target)
+    return copied
+
+
+def write_report_html(traces, layout, options, output_path, runtime_url=""):
+    """
+    Writes a report page to output_path: the container elements, the shared
+    runtime (report-runtime.js/.css, also copied next to output_path) and one
+    inline script that hands {"options": options, "figure": {"data": traces,
+    "layout": layout}} to the runtime.
+
+    options configures the runtime for the report:
+      - categoryKey: customdata key shown in the details title
+      - columns: [{"field": ..., "header": ...}] of the details table
+      - zoomYears: year_zoom_ranges() of the chart, one zoom button per year
+
+    runtime_url is the URL prefix of the runtime files as seen from the page,
+    e.g. "assets/reports/" for the Angular app (default: same directory).
+
+    The figure is streamed: traces may be a generator, and each trace is encoded
+    (NumPy arrays and scalars included) and written on its own, so the whole
+    figure is never held in memory as one JSON string.
+    """
+    install_report_runtime(os.path.dirname(os.path.abspath(output_path)))
+
+    head, tail = REPORT_PAGE.replace("RUNTIME_URL", runtime_url).split("REPORT_CONFIG", 1)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(head)
+        f.write('{"options": ')
+        f.write(json.dumps(options))
+        f.write(', "figure": {"data": [')
+        for i, trace in enumerate(traces):
+            if i:
+                f.write(", ")
+            f.write(json.dumps(trace, default=_numpy_default))
+        f.write('], "layout": ')
+        f.write(json.dumps({"template": _default_template(), **layout}, default=_numpy_default))
+        f.write("}}")
+        f.write(tail)
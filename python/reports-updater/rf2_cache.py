@@ -0,0 +1,181 @@
+"""
+Persistent columnar cache of parsed RF2 tables.
+Each table is parsed once with rf2_loader and stored as an uncompressed Arrow IPC
+file under <cache_root>/<release date>/ (International Edition) or
+<cache_root>/<edition module id>/<release date>/ (other editions), which later
+runs memory-map instead of re-parsing the TSV.
+"""
+import os
+import re
+import shutil
+from tempfile import TemporaryDirectory
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from ci_utils import log
+from rf2_loader import get_schema, load_rf2, ARROW_SUFFIX
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "SNOMED_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+)
+
+
+def get_cache_dir(release_date: str, cache_root: str = None, module_id: str = None) -> str:
+    """
+    Returns the cache folder for a release date (YYYYMMDD, as returned by
+    file_locator.parse_snomed_release_date) of the International Edition, or
+    of the edition with module_id (e.g. "731000124108") for other editions.
+    """
+    if module_id:
+        return os.path.join(cache_root or DEFAULT_CACHE_DIR, module_id, release_date)
+    return os.path.join(cache_root or DEFAULT_CACHE_DIR, release_date)
+
+
+def get_cache_path(release_date: str,
+                   file_type: str,
+                   release_type: str,
+                   cache_root: str = None,
+                   module_id: str = None) -> str:
+    """
+    Returns the path of the cached table, e.g.
+    "<cache_root>/20250201/concept_full.arrow".
+    """
+    file_name = f"{file_type.lower()}_{release_type.lower()}{ARROW_SUFFIX}"
+    return os.path.join(get_cache_dir(release_date, cache_root, module_id), file_name)
+
+
+def is_cached(release_date: str, tables, cache_root: str = None, module_id: str = None) -> bool:
+    """
+    True if every (file_type, release_type) pair in tables is already cached
+    for the release date (of the edition module_id, see get_cache_dir).
+    """
+    return all(
+        os.path.exists(get_cache_path(release_date, file_type, release_type, cache_root, module_id))
+        for file_type, release_type in tables
+    )
+
+
+def build_cache(rf2_path: str,
+                file_type: str,
+                release_type: str,
+                release_date: str,
+                cache_root: str = None,
+                module_id: str = None) -> str:
+    """
+    Converts an RF2 file to its cached Arrow table (all columns, typed by the
+    rf2_loader schema) unless it is already cached. Returns the cache path,
+    which can be passed to rf2_loader.load_rf2 in place of the RF2 path.
+    rf2_path may also be a list of files of the same type, cached as one table.
+    module_id selects the cache folder of an edition other than the
+    International Edition (see get_cache_dir).
+    """
+    cache_path = get_cache_path(release_date, file_type, release_type, cache_root, module_id)
+    if os.path.exists(cache_path):
+        return cache_path
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    sources = rf2_path if isinstance(rf2_path, list) else [rf2_path]
+    log(f"🗄  Caching {', '.join(os.path.basename(str(source)) for source in sources)} -> {cache_path}")
+    df = load_rf2(rf2_path, file_type)
+    _write_table(df, cache_path)
+    return cache_path
+
+
+def staging_root(cache_root: str = None):
+    """
+    Temporary cache root inside cache_root (a TemporaryDirectory, deleted on
+    exit) to build tables into with build_cache before they are known to be
+    good, e.g. while their release download is not verified yet. Move them
+    into the cache with publish_cache.
+    """
+    root = cache_root or DEFAULT_CACHE_DIR
+    os.makedirs(root, exist_ok=True)
+    return TemporaryDirectory(prefix=".staging-", dir=root)
+
+
+def publish_cache(staged_path: str,
+                  file_type: str,
+                  release_type: str,
+                  release_date: str,
+                  cache_root: str = None,
+                  module_id: str = None) -> str:
+    """
+    Moves a table built under a staging_root into the cache (same arguments
+    as get_cache_path) and returns its cache path.
+    """
+    cache_path = get_cache_path(release_date, file_type, release_type, cache_root, module_id)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    os.replace(staged_path, cache_path)
+    return cache_path
+
+
+def build_empty_cache(file_type: str,
+                      release_type: str,
+                      release_date: str,
+                      cache_root: str = None,
+                      module_id: str = None) -> str:
+    """
+    Caches an empty table (with the rf2_loader schema) for an RF2 file that a
+    release does not include, e.g. a national extension without historical
+    associations, so readers get no rows instead of a missing file.
+    Returns the cache path.
+    """
+    cache_path = get_cache_path(release_date, file_type, release_type, cache_root, module_id)
+    if not os.path.exists(cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        schema = get_schema(file_type)
+        _write_table(pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in schema.items()}), cache_path)
+    return cache_path
+
+
+def prune_cache(keep_dirs, cache_root: str = None):
+    """
+    Deletes the cached releases (get_cache_dir folders) that are not in
+    keep_dirs, e.g. those of releases superseded in the feed, so the cache
+    does not grow by one release every month. Other files in the cache root
+    (the syndication feed cache) are kept.
+    """
+    root = cache_root or DEFAULT_CACHE_DIR
+    keep = {os.path.normpath(path) for path in keep_dirs}
+    for release_dir in _release_dirs(root):
+        if os.path.normpath(release_dir) not in keep:
+            log(f"🗑  Removing cached release {os.path.relpath(release_dir, root)}")
+            shutil.rmtree(release_dir)
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        module_dir = os.path.join(root, name)
+        if _MODULE_DIR.fullmatch(name) and os.path.isdir(module_dir) and not os.listdir(module_dir):
+            os.rmdir(module_dir)
+
+
+# Release folders are named by date (YYYYMMDD); edition folders by module id (longer)
+_DATE_DIR = re.compile(r"\d{8}")
+_MODULE_DIR = re.compile(r"\d{9,}")
+
+
+def _release_dirs(root):
+    if not os.path.isdir(root):
+        return []
+    release_dirs = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        if _DATE_DIR.fullmatch(name):
+            release_dirs.append(path)
+        elif _MODULE_DIR.fullmatch(name):
+            release_dirs += [
+                os.path.join(path, date) for date in os.listdir(path)
+                if _DATE_DIR.fullmatch(date) and os.path.isdir(os.path.join(path, date))
+            ]
+    return release_dirs
+
+
+def _write_table(df, cache_path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    # Write to a temporary name first so an interrupted run never leaves a
+    # truncated table that later runs would treat as complete.
+    tmp_path = cache_path + ".tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, cache_path)
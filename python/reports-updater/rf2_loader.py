@@ -0,0 +1,249 @@
+"""
+Typed loader for SNOMED CT RF2 release files.
+Every detector reads its RF2 tables through load_rf2() so ids, effectiveTime
+and active flags are parsed once into compact numeric columns.
+"""
+import csv
+import os
+import zipfile
+from contextlib import contextmanager, nullcontext
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from ci_utils import log
+from file_locator import ZipMember
+
+FSN_TYPE_ID = 900000000000003001
+
+SCTID = "int64"
+EFFECTIVE_TIME = "int32"
+ACTIVE = "uint8"
+
+# Tables cached by rf2_cache are Arrow IPC files with this suffix
+ARROW_SUFFIX = ".arrow"
+
+# Column dtypes per RF2 file type. Keys match the file_type names used by
+# file_locator.getFilePath, so both can be driven from the same arguments.
+RF2_SCHEMAS = {
+    "concept": {
+        "id": SCTID,
+        "effectiveTime": EFFECTIVE_TIME,
+        "active": ACTIVE,
+        "moduleId": SCTID,
+        "definitionStatusId": SCTID,
+    },
+    "description": {
+        "id": SCTID,
+        "effectiveTime": EFFECTIVE_TIME,
+        "active": ACTIVE,
+        "moduleId": SCTID,
+        "conceptId": SCTID,
+        "languageCode": str,
+        "typeId": SCTID,
+        "term": str,
+        "caseSignificanceId": SCTID,
+    },
+    "refset_inactivation": {
+        "id": str,
+        "effectiveTime": EFFECTIVE_TIME,
+        "active": ACTIVE,
+        "moduleId": SCTID,
+        "refsetId": SCTID,
+        "referencedComponentId": SCTID,
+        "valueId": SCTID,
+    },
+    "refset_historical": {
+        "id": str,
+        "effectiveTime": EFFECTIVE_TIME,
+        "active": ACTIVE,
+        "moduleId": SCTID,
+        "refsetId": SCTID,
+        "referencedComponentId": SCTID,
+        "targetComponentId": SCTID,
+    },
+}
+
+
+def get_schema(file_type: str) -> dict:
+    """
+    Returns the {column: dtype} schema registered for an RF2 file type
+    (one of "concept", "description", "refset_inactivation", "refset_historical").
+    """
+    schema = RF2_SCHEMAS.get(file_type.lower())
+    if schema is None:
+        raise ValueError(
+            f"Unknown file_type: {file_type}. Must be one of {sorted(RF2_SCHEMAS)}."
+        )
+    return schema
+
+
+def rf2_exists(path) -> bool:
+    """
+    True if the RF2 file exists: a path on disk, or a ZipMember present in its
+    archive. For a list of sources (see load_rf2), all of them must exist.
+    """
+    if isinstance(path, list):
+        return all(rf2_exists(part) for part in path)
+    if isinstance(path, ZipMember):
+        if not os.path.exists(path.zip_path):
+            return False
+        with zipfile.ZipFile(path.zip_path, "r") as zip_ref:
+            try:
+                zip_ref.getinfo(path.name)
+            except KeyError:
+                return False
+        return True
+    return os.path.exists(path)
+
+
+def load_rf2(path, file_type: str, columns=None) -> pd.DataFrame:
+    """
+    Reads an RF2 file into a DataFrame with the dtypes of its schema.
+
+    Parameters
+    ----------
+    path : str, os.PathLike, ZipMember or list
+        Path to the tab-separated RF2 file, its Arrow table in the rf2_cache
+        (memory-mapped instead of parsed), or a ZipMember from
+        file_locator.getFilePath (streamed from the release ZIP). A list of
+        them is read as one table, in order: e.g. the cached International
+        Edition tables an extension is based on, followed by the extension's.
+    file_type : str
+        Schema to apply, see RF2_SCHEMAS.
+    columns : list[str], optional
+        Only these columns are read (in this order). Defaults to all columns.
+
+    SCTIDs are parsed to int64, effectiveTime to int32 and active to uint8.
+    Only free-text columns (term, languageCode, refset member UUIDs) stay strings.
+    Malformed rows (wrong number of fields, or a non-numeric value in a
+    numeric column) are skipped.
+    """
+    schema, columns = _resolve_request(path, file_type, columns)
+
+    if isinstance(path, list):
+        return pd.concat([load_rf2(part, file_type, columns) for part in path], ignore_index=True)
+
+    if not isinstance(path, ZipMember):
+        path = os.fspath(path)
+        if path.endswith(ARROW_SUFFIX):
+            table = feather.read_table(path, columns=columns, memory_map=True)
+            return table.to_pandas()
+
+    try:
+        return _read_rf2_tsv(path, schema, columns)
+    except (ValueError, OverflowError) as e:
+        log(f"⚠ Malformed rows in {path} ({e}); re-reading it without them")
+        return _read_rf2_tsv(path, schema, columns, typed=False)
+
+
+def iter_rf2(path, file_type: str, columns=None, chunksize: int = 500_000):
+    """
+    Streaming variant of load_rf2: yields the file as typed DataFrames of at
+    most chunksize rows (cached Arrow tables are yielded per record batch), so
+    callers can filter rows while reading instead of holding the whole table.
+    """
+    schema, columns = _resolve_request(path, file_type, columns)
+
+    if isinstance(path, list):
+        for part in path:
+            yield from iter_rf2(part, file_type, columns, chunksize)
+        return
+
+    if not isinstance(path, ZipMember):
+        path = os.fspath(path)
+        if path.endswith(ARROW_SUFFIX):
+            with pa.memory_map(path, "r") as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i).select(columns).to_pandas()
+            return
+
+    rows = 0
+    try:
+        for chunk in _read_rf2_tsv(path, schema, columns, chunksize):
+            rows += len(chunk)
+            yield chunk
+    except (ValueError, OverflowError) as e:
+        # Same as load_rf2, from the first row not yielded yet
+        log(f"⚠ Malformed rows in {path} ({e}); reading the rest without them")
+        yield from _read_rf2_tsv(path, schema, columns, chunksize, typed=False, skip_rows=rows)
+
+
+def _resolve_request(path, file_type: str, columns):
+    schema = get_schema(file_type)
+    if columns is None:
+        columns = list(schema)
+    unknown = [c for c in columns if c not in schema]
+    if unknown:
+        raise ValueError(f"Unknown columns for {file_type}: {unknown}")
+
+    if not rf2_exists(path):
+        raise FileNotFoundError(f"RF2 file not found: {path}")
+    return schema, columns
+
+
+def _read_rf2_tsv(source, schema: dict, columns: list, chunksize: int = None, typed: bool = True,
+                  skip_rows: int = 0):
+    """
+    Parses a TSV RF2 source (path or ZipMember). Returns a DataFrame, or with
+    chunksize a generator of DataFrames.
+
+    typed parses numeric columns straight to their dtype, which raises on a
+    non-numeric value; otherwise they are read as text and converted
+    afterwards, dropping the rows that do not convert. skip_rows (with
+    chunksize) leaves out that many leading rows.
+    """
+    options = dict(
+        sep="\t",
+        usecols=columns,
+        dtype={c: schema[c] if typed else str for c in columns},
+        quoting=csv.QUOTE_NONE,
+        na_filter=False,
+        on_bad_lines="skip",
+        encoding="utf-8",
+    )
+    if chunksize is None:
+        with _open_tsv(source) as f:
+            df = pd.read_csv(f, **options)[columns]
+        return df if typed else _convert_columns(df, schema)
+    return _iter_chunks(source, options, columns, chunksize, schema if not typed else None, skip_rows)
+
+
+@contextmanager
+def _open_tsv(source):
+    if isinstance(source, ZipMember):
+        # Decompress the member on the fly; nothing is written to disk
+        with zipfile.ZipFile(source.zip_path, "r") as zip_ref:
+            with zip_ref.open(source.name) as f:
+                yield f
+    else:
+        with nullcontext(source) as path:
+            yield path
+
+
+def _iter_chunks(source, options: dict, columns: list, chunksize: int, convert_schema=None, skip_rows: int = 0):
+    with _open_tsv(source) as f, pd.read_csv(f, chunksize=chunksize, **options) as reader:
+        for chunk in reader:
+            chunk = chunk[columns]
+            if skip_rows:
+                skipped = min(skip_rows, len(chunk))
+                chunk = chunk.iloc[skipped:]
+                skip_rows -= skipped
+            if convert_schema is not None:
+                chunk = _convert_columns(chunk, convert_schema)
+            if len(chunk):
+                yield chunk
+
+
+def _convert_columns(df, schema: dict):
+    """Converts text columns to the numeric dtypes of schema, dropping rows with values that do not parse."""
+    numeric = [c for c in df.columns if schema[c] is not str]
+    parsed = {c: pd.to_numeric(df[c], errors="coerce") for c in numeric}
+    valid = pd.concat([values.notna() for values in parsed.values()], axis=1).all(axis=1) if numeric else None
+    df = df.assign(**parsed)
+    if valid is not None:
+        dropped = int((~valid).sum())
+        if dropped:
+            log(f"⚠ Skipped {dropped} rows with non-numeric ids")
+        df = df[valid]
+    return df.astype({c: schema[c] for c in numeric}).reset_index(drop=True)
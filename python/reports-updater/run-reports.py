@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
+import hashlib
+import multiprocessing
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tempfile import TemporaryDirectory
 
 from dotenv import load_dotenv
@@ -12,97 +15,468 @@ from fsn_changes import detect_fsn_changes
 from fsn_changes_graph_details import generate_fsn_changes_report
 from new_concepts import detect_new_concepts
 from new_concepts_graph_details import generate_new_concepts_report
-from file_locator import getFilePath, parse_snomed_release_date
-from syndication_downloader import download_latest_international
-from ci_utils import log
+from concept_history import load_concept_history
+from fsn_lookup import build_fsn_lookup
+from file_locator import getFilePath, parse_description_languages, parse_release_edition, parse_snomed_release_date
+from syndication_downloader import (
+    INTERNATIONAL_EDITION,
+    get_edition_entry,
+    get_latest_edition_entry,
+    load_feed,
+    stream_latest_international,
+)
+from rf2_cache import (
+    build_cache,
+    build_empty_cache,
+    get_cache_dir,
+    get_cache_path,
+    is_cached,
+    prune_cache,
+    publish_cache,
+    staging_root,
+)
+from rf2_loader import load_rf2
+from precompress import precompress_files
+from report_utils import RUNTIME_FILES
+from release_registry import (
+    generator_fingerprint,
+    is_up_to_date,
+    load_registry,
+    record_release,
+    release_key,
+    save_registry,
+)
+from ci_utils import log, set_output
+
+# RF2 tables read by the detectors, as (file_type, release_type)
+REQUIRED_TABLES = [
+    ("concept", "full"),
+    ("concept", "snapshot"),
+    ("description", "full"),
+    ("description", "snapshot"),
+    ("refset_inactivation", "full"),
+    ("refset_historical", "full"),
+]
+
+# Tables a national package may not include: read as empty tables
+OPTIONAL_TABLES = [
+    ("refset_inactivation", "full"),
+    ("refset_historical", "full"),
+]
+
+# Excel copies of the report data are optional (SNOMED_EXPORT_EXCEL=1)
+EXPORT_EXCEL = os.getenv("SNOMED_EXPORT_EXCEL", "").lower() in ("1", "true", "yes")
+
+# Regenerate the reports even if the registry says they are up to date
+FORCE_REPORTS = os.getenv("SNOMED_FORCE_REPORTS", "").lower() in ("1", "true", "yes")
+
+# National extensions or editions reported on besides the International
+# Edition: comma-separated edition module ids (SNOMED_EXTENSIONS=731000124108,...)
+EXTENSIONS = [module_id.strip() for module_id in os.getenv("SNOMED_EXTENSIONS", "").split(",") if module_id.strip()]
+
+# Editions whose reports are generated at the same time, one process each
+# (default: all of them, up to the number of CPUs); each holds its tables in memory
+EDITION_WORKERS = int(os.getenv("SNOMED_EDITION_WORKERS", "0")) or None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def download_and_cache_release(release, module_id=None):
+    """
+    Downloads the release ZIP into a temporary directory and converts the required
+    RF2 tables into the columnar cache, streaming each one straight from the ZIP
+    (nothing is extracted). Each table is parsed as soon as its bytes are
+    downloaded, while the rest of the ZIP is still downloading. The tables are
+    built in a staging folder and only moved into the cache once the whole
+    download has been verified (size / SHA-256), so a corrupt ZIP never
+    leaves tables that later runs would take as cached.
+
+    module_id is the edition of a release other than the International Edition
+    (its cache folder, see rf2_cache). The descriptions of such a national
+    package are read in all its languages, as one table; the OPTIONAL_TABLES
+    it does not include are cached empty, any other missing table is an error.
+
+    The tables are cached under the release date of the feed entry, the one
+    release_tables looks them up by (the date in the ZIP folder name only if
+    the feed has none).
+    Returns {(file_type, release_type): cache_path}.
+    """
+    release_date = release.get("release_date")
+
+    def select(release_zip):
+        nonlocal release_date
+        log(f"Using release folder: {release_zip.root_folder} (read from ZIP)")
+
+        folder_date = parse_snomed_release_date(release_zip)
+        if release_date is None:
+            release_date = folder_date
+        elif folder_date != release_date:
+            log(f"⚠ Release folder date {folder_date} differs from the feed date {release_date}; "
+                f"caching under {release_date}")
+        edition = parse_release_edition(release_zip)
+        languages = ["en"] if module_id is None else parse_description_languages(release_zip, edition)
+        log(f"📅 Parsed release date from folder name: {folder_date} "
+            f"(files of edition {edition}, descriptions in {', '.join(languages) or 'no language'})")
+
+        selected = {}
+        for file_type, release_type in REQUIRED_TABLES:
+            for language in languages if file_type == "description" else [None]:
+                name = getFilePath(release_zip, file_type, release_type, language or "en", edition).name
+                if module_id is None or name in release_zip.members:
+                    selected[name] = (file_type, release_type, language)
+
+        missing = [
+            f"{file_type} {release_type}"
+            for file_type, release_type in REQUIRED_TABLES
+            if (file_type, release_type) not in OPTIONAL_TABLES
+            and not any(table[:2] == (file_type, release_type) for table in selected.values())
+        ]
+        if missing:
+            raise FileNotFoundError(f"RF2 tables missing from {release['title']} ({release_zip.zip_path}): {', '.join(missing)}")
+        return selected
+
+    with TemporaryDirectory(prefix="snomed-release-") as temp_dir, staging_root() as staging:
+        def process(member, table):
+            file_type, release_type, language = table
+            cache_root = os.path.join(staging, language) if language else staging
+            return build_cache(member, file_type, release_type, release_date, cache_root=cache_root, module_id=module_id)
+
+        data_dir = os.path.join(temp_dir, "data")
+        staged = stream_latest_international(select, process, data_dir, release=release)
+
+        # stream_latest_international returns once the download is verified
+        staged_tables = {}
+        for (file_type, release_type, _), staged_path in sorted(staged.items(), key=lambda item: str(item[0])):
+            staged_tables.setdefault((file_type, release_type), []).append(staged_path)
+        tables = {}
+        for (file_type, release_type), staged_paths in staged_tables.items():
+            if len(staged_paths) == 1:
+                tables[(file_type, release_type)] = publish_cache(
+                    staged_paths[0], file_type, release_type, release_date, module_id=module_id
+                )
+            else:
+                # Descriptions in several languages: cached as one table
+                tables[(file_type, release_type)] = build_cache(
+                    staged_paths, file_type, release_type, release_date, module_id=module_id
+                )
+
+    for file_type, release_type in REQUIRED_TABLES:
+        if (file_type, release_type) not in tables:
+            log(f"⚠ {release['title']} has no {file_type} {release_type} table; using an empty one")
+            tables[(file_type, release_type)] = build_empty_cache(
+                file_type, release_type, release_date, module_id=module_id
+            )
+    return tables
+
+
+def cache_module_id(release):
+    """Cache folder module id of a feed entry (see rf2_cache.get_cache_dir): None for the International Edition."""
+    return None if release["edition"] == INTERNATIONAL_EDITION else release["edition"]
+
+
+def current_releases(latest, entries):
+    """
+    Releases whose cached tables the next runs can use: the latest release of
+    each edition and the International Edition releases the extensions depend on.
+    Keyed by content version.
+    """
+    current = {release["content_version"]: release for release in latest}
+    for release in latest:
+        base = get_edition_entry(entries, release["dependency"]) if release.get("dependency") else None
+        if base is not None:
+            current[base["content_version"]] = base
+    return current
+
+
+def release_tables(release, module_id=None):
+    """
+    Cached RF2 tables of a release, {(file_type, release_type): cache_path};
+    the release is downloaded and cached first unless it already is.
+    module_id as in download_and_cache_release.
+    """
+    release_date = release["release_date"]
+    if release_date and is_cached(release_date, REQUIRED_TABLES, module_id=module_id):
+        log(f"🗄  Using cached RF2 tables of {release['title']} {release_date}")
+        return {
+            (file_type, release_type): get_cache_path(release_date, file_type, release_type, module_id=module_id)
+            for file_type, release_type in REQUIRED_TABLES
+        }
+    log(f"🔽 Downloading {release['title']} {release_date}...")
+    return download_and_cache_release(release, module_id)
+
+
+def includes_international(tables):
+    """
+    True if an edition's own tables hold International Edition content (core
+    module concepts): an edition package, rather than an extension that is
+    read on top of the International Edition.
+    """
+    modules = load_rf2(tables[("concept", "snapshot")], "concept", columns=["moduleId"])["moduleId"]
+    return bool((modules == int(INTERNATIONAL_EDITION)).any())
+
+
+def base_release(release, entries):
+    """
+    Feed entry of the International Edition an extension is based on: its
+    declared dependency if the feed lists it, else the latest one.
+    """
+    if release.get("dependency"):
+        base = get_edition_entry(entries, release["dependency"])
+        if base is not None:
+            return base
+        log(f"⚠ {release['dependency']} (base of {release['title']}) is not in the feed; using the latest International Edition")
+    return get_latest_edition_entry(entries, INTERNATIONAL_EDITION)
+
+
+def edition_paths(edition):
+    """
+    Output locations of an edition's reports: the International Edition keeps
+    src/assets/reports/ (and output/ for Excel); other editions get a
+    subfolder editions/<module id>/ of both.
+    """
+    assets_dir = os.path.normpath(os.path.join(BASE_DIR, "../../src/assets/reports"))
+    assets_url = "assets/reports/"
+    output_dir = os.path.join(BASE_DIR, "output")
+    if edition != INTERNATIONAL_EDITION:
+        assets_dir = os.path.join(assets_dir, "editions", edition)
+        assets_url = f"{assets_url}editions/{edition}/"
+        output_dir = os.path.join(output_dir, edition)
+    return {"assets_dir": assets_dir, "assets_url": assets_url, "output_dir": output_dir}
+
+
+def generate_edition_reports(job):
+    """
+    Generates the three reports of one edition from its cached tables and
+    returns the files and folders written. job is a dict with the edition's
+    feed entry (release), its tables ({(file_type, release_type): cache path,
+    or [International base path, extension path]}) and its edition_paths().
+    Runs in a worker process when several editions are processed.
+    """
+    release = job["release"]
+    tables = job["tables"]
+    log(f"🧮 Generating reports of {release['title']} {release['release_date']}...")
+
+    concept_full_path = tables[("concept", "full")]
+    concept_snapshot_path = tables[("concept", "snapshot")]
+    description_full_path = tables[("description", "full")]
+    description_snapshot_path = tables[("description", "snapshot")]
+    refset_inactivation_path = tables[("refset_inactivation", "full")]
+    refset_historical_associations_path = tables[("refset_historical", "full")]
 
-def main():
     # ------------------------------------------------------------------
-    # 1. Descargar y extraer release SNOMED (vía syndication feed)
-    #    en un directorio temporal fuera del repo para evitar commits accidentales
+    # 3. Output directories
+    # ------------------------------------------------------------------
+    # Excel files -> local output directory (not for web), only if requested
+    output_dir = job["output_dir"]
+    if EXPORT_EXCEL:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # HTML files -> Angular assets (for web serving)
+    assets_dir = job["assets_dir"]
+    os.makedirs(assets_dir, exist_ok=True)
+
+    def report_assets(report):
+        # Detalle de cada barra en archivos JSON aparte, pedidos al hacer click,
+        # y runtime JS/CSS compartido (report-runtime.*) junto a los HTML.
+        # La app Angular inyecta el HTML, así que las URLs parten de la raíz de la app.
+        return {
+            "details_dir": os.path.join(assets_dir, report),
+            "details_url": f"{job['assets_url']}{report}",
+            "runtime_url": job["assets_url"],
+        }
+
+    def excel_path(filename):
+        return os.path.join(output_dir, filename) if EXPORT_EXCEL else None
+
+    inactivations_xlsx = excel_path("detect-inactivations.xlsx")
+    inactivations_html = os.path.join(assets_dir, "detect_inactivations_by_reason.html")
+    fsn_changes_xlsx = excel_path("fsn-changes.xlsx")
+    fsn_changes_html = os.path.join(assets_dir, "fsn_changes_with_details.html")
+    new_concepts_xlsx = excel_path("list-new-concepts.xlsx")
+    new_concepts_html = os.path.join(assets_dir, "new_concepts_by_semantic_tag.html")
+
+    # ------------------------------------------------------------------
+    # 4. Generar reportes
     # ------------------------------------------------------------------
     log("------------------------------------------------------")
-    log("🔽 Downloading and extracting latest SNOMED International release...")
+    log("🧮 Running SNOMED analytics pipeline...")
     log("------------------------------------------------------")
 
-    with TemporaryDirectory(prefix="snomed-release-") as temp_dir:
-        data_dir = os.path.join(temp_dir, "data")
-        os.makedirs(data_dir, exist_ok=True)
+    # Una sola pasada sobre sct2_Concept_Full, compartida por los reportes
+    log("Building concept history from the Full concept table...")
+    concept_history = load_concept_history(concept_full_path)
+
+    # Diccionario conceptId -> FSN, construido una vez para todos los reportes
+    log("Building FSN lookup from the Snapshot description table...")
+    fsn_lookup = build_fsn_lookup(description_snapshot_path)
+
+    # Los detectores devuelven DataFrames que pasan directo a los reportes HTML
+    inactivations_df = detect_inactivations(
+        concept_full_path,
+        description_snapshot_path,
+        refset_inactivation_path,
+        refset_historical_associations_path,
+        inactivations_xlsx,
+        concept_history=concept_history,
+        fsn_lookup=fsn_lookup
+    )
+    generate_inactivation_report(
+        inactivations_df,
+        inactivations_html,
+        1500,
+        **report_assets("detect_inactivations")
+    )
+
+    fsn_changes_df = detect_fsn_changes(
+        description_full_path,
+        concept_snapshot_path,
+        fsn_changes_xlsx
+    )
+    generate_fsn_changes_report(
+        fsn_changes_df,
+        fsn_changes_html,
+        1500,
+        **report_assets("fsn_changes")
+    )
+
+    new_concepts_df = detect_new_concepts(
+        concept_full_path,
+        description_snapshot_path,
+        new_concepts_xlsx,
+        concept_history=concept_history,
+        fsn_lookup=fsn_lookup
+    )
+    generate_new_concepts_report(
+        new_concepts_df,
+        new_concepts_html,
+        1500,
+        **report_assets("new_concepts")
+    )
+
+    # ------------------------------------------------------------------
+    # 5. Versiones precomprimidas (.gz / .br) de los HTML y del runtime para el hosting estático
+    # ------------------------------------------------------------------
+    log("Precompressing HTML reports...")
+    served_files = [inactivations_html, fsn_changes_html, new_concepts_html] + [
+        os.path.join(assets_dir, filename) for filename in RUNTIME_FILES
+    ]
+    compressed_files = precompress_files(served_files)
+
+    detail_dirs = [
+        report_assets(report)["details_dir"]
+        for report in ("detect_inactivations", "fsn_changes", "new_concepts")
+    ]
+    return served_files + compressed_files + detail_dirs
+
+
+def main():
+    # ------------------------------------------------------------------
+    # 1. Resolver el último release de cada edición (vía syndication feed)
+    # ------------------------------------------------------------------
+    log("------------------------------------------------------")
+    log("🔽 Resolving latest SNOMED releases...")
+    log("------------------------------------------------------")
 
-        root_folder = download_latest_international(data_dir)
-        log(f"Using release folder: {root_folder}")
+    # El registro de releases procesados permite terminar sin descargar nada
+    # cuando ni el feed ni el código de los reportes cambiaron
+    registry = load_registry()
+    fingerprint = generator_fingerprint()
+    editions = [INTERNATIONAL_EDITION] + [edition for edition in EXTENSIONS if edition != INTERNATIONAL_EDITION]
+    entries, _ = load_feed(editions=editions)
 
-        # Log parsed date from folder name
+    # Sólo la International Edition es obligatoria: una extensión que no está
+    # en el feed (module id mal escrito, extensión retirada) se omite
+    latest = [get_latest_edition_entry(entries, INTERNATIONAL_EDITION)]
+    for edition in editions[1:]:
         try:
-            parsed_date = parse_snomed_release_date(root_folder)
-            log(f"📅 Parsed release date from folder name: {parsed_date}")
-        except Exception as e:
-            log(f"⚠ Warning: Could not parse date from folder name: {e}")
-
-        # ------------------------------------------------------------------
-        # 2. Localizar archivos RF2
-        # ------------------------------------------------------------------
-        log(f'Locating files in: {root_folder}')
-        concept_full_path = getFilePath(root_folder, "concept", "full")
-        concept_snapshot_path = getFilePath(root_folder, "concept", "snapshot")
-        description_full_path = getFilePath(root_folder, "description", "full")
-        description_snapshot_path = getFilePath(root_folder, "description", "snapshot")
-        refset_inactivation_path = getFilePath(root_folder, "refset_inactivation", "full")
-        refset_historical_associations_path = getFilePath(root_folder, "refset_historical", "full")
-
-        # ------------------------------------------------------------------
-        # 3. Output directories
-        # ------------------------------------------------------------------
-        # Excel files -> local output directory (not for web)
-        output_dir = os.path.join(os.path.dirname(__file__), "output")
-        os.makedirs(output_dir, exist_ok=True)
+            latest.append(get_latest_edition_entry(entries, edition))
+        except RuntimeError as e:
+            log(f"⚠ Skipping edition {edition}: {e}")
+
+    releases = []
+    for release in latest:
+        if not FORCE_REPORTS and is_up_to_date(registry, release_key(release), fingerprint):
+            log(f"✅ Reports are up to date for {release_key(release)}")
+        else:
+            releases.append(release)
+    if not releases:
+        log("✅ Nothing to do")
+        return
+
+    # ------------------------------------------------------------------
+    # 2. Tablas RF2 de cada edición: desde la caché columnar, o descargar
+    #    (en paralelo) en un directorio temporal y convertir a la caché.
+    #    Las extensiones se leen sobre las tablas de la International Edition
+    #    de la que dependen, compartidas a través de la misma caché.
+    # ------------------------------------------------------------------
+    def cache_edition(release):
+        return release_tables(release, cache_module_id(release))
+
+    with ThreadPoolExecutor(max_workers=len(releases)) as pool:
+        edition_tables = list(pool.map(cache_edition, releases))
+
+    bases = [
+        base_release(release, entries)
+        if release["edition"] != INTERNATIONAL_EDITION and not includes_international(tables) else None
+        for release, tables in zip(releases, edition_tables)
+    ]
+    base_versions = {base["content_version"]: base for base in bases if base is not None}
+    with ThreadPoolExecutor(max_workers=max(1, len(base_versions))) as pool:
+        base_tables = dict(zip(base_versions, pool.map(release_tables, base_versions.values())))
+
+    jobs = []
+    for release, tables, base in zip(releases, edition_tables, bases):
+        if base is not None:
+            log(f"🧩 {release['title']} is read on top of {base['title']} {base['release_date']}")
+            international = base_tables[base["content_version"]]
+            tables = {key: [international[key], path] for key, path in tables.items()}
+        jobs.append({"release": release, "tables": tables, **edition_paths(release["edition"])})
 
-        # HTML files -> Angular assets (for web serving)
-        assets_dir = os.path.join(os.path.dirname(__file__), "../../src/assets/reports")
-        os.makedirs(assets_dir, exist_ok=True)
-
-        inactivations_xlsx = os.path.join(output_dir, "detect-inactivations.xlsx")
-        inactivations_html = os.path.join(assets_dir, "detect_inactivations_by_reason.html")
-        fsn_changes_xlsx = os.path.join(output_dir, "fsn-changes.xlsx")
-        fsn_changes_html = os.path.join(assets_dir, "fsn_changes_with_details.html")
-        new_concepts_xlsx = os.path.join(output_dir, "list-new-concepts.xlsx")
-        new_concepts_html = os.path.join(assets_dir, "new_concepts_by_semantic_tag.html")
-
-        # ------------------------------------------------------------------
-        # 4. Generar reportes
-        # ------------------------------------------------------------------
-        log("------------------------------------------------------")
-        log("🧮 Running SNOMED analytics pipeline...")
-        log("------------------------------------------------------")
-
-        detect_inactivations(
-            concept_full_path,
-            description_snapshot_path,
-            refset_inactivation_path,
-            refset_historical_associations_path,
-            inactivations_xlsx
-        )
-        generate_inactivation_report(inactivations_xlsx, inactivations_html, 1500)
-
-        detect_fsn_changes(
-            description_full_path,
-            concept_snapshot_path,
-            fsn_changes_xlsx
-        )
-        generate_fsn_changes_report(fsn_changes_xlsx, fsn_changes_html, 1500)
-
-        detect_new_concepts(
-            concept_full_path,
-            description_snapshot_path,
-            new_concepts_xlsx
-        )
-        generate_new_concepts_report(new_concepts_xlsx, new_concepts_html, 1500)
-
-        log("------------------------------------------------------")
-        print("✅ All reports generated successfully!")
-        print(f"   Excel files: {output_dir}")
-        print(f"   HTML files:  {assets_dir}")
-        log("------------------------------------------------------")
+    # Releases anteriores ya no se usan: se borran de la caché, que en GitHub
+    # Actions se guarda con la clave de los releases vigentes. Las carpetas que
+    # leen los reportes de esta ejecución se conservan siempre.
+    current = current_releases(latest, entries)
+    used_dirs = {
+        os.path.dirname(path)
+        for job in jobs
+        for paths in job["tables"].values()
+        for path in (paths if isinstance(paths, list) else [paths])
+    }
+    prune_cache(sorted(used_dirs) + [
+        get_cache_dir(release["release_date"], module_id=cache_module_id(release))
+        for release in current.values()
+        if release["release_date"]
+    ])
+    cache_key = hashlib.sha256("\n".join(sorted(current)).encode()).hexdigest()[:16]
+    set_output("cache-key", f"snomed-rf2-cache-{cache_key}")
+
+    # ------------------------------------------------------------------
+    # Reportes de cada edición, en un proceso por edición
+    # ------------------------------------------------------------------
+    if len(jobs) == 1:
+        artifacts = [generate_edition_reports(jobs[0])]
+    else:
+        workers = min(len(jobs), EDITION_WORKERS or os.cpu_count() or 1)
+        log(f"🧮 Generating the reports of {len(jobs)} editions in {workers} processes...")
+        # spawn: the parent already ran download threads, which fork would copy mid-state
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            artifacts = list(pool.map(generate_edition_reports, jobs))
+
+    # ------------------------------------------------------------------
+    # 6. Registrar los releases procesados y sus archivos
+    # ------------------------------------------------------------------
+    for release, files in zip(releases, artifacts):
+        record_release(registry, release, fingerprint, files)
+    save_registry(registry)
+
+    log("------------------------------------------------------")
+    print("✅ All reports generated successfully!")
+    for job in jobs:
+        print(f"   {job['release']['title']}:")
+        if EXPORT_EXCEL:
+            print(f"      Excel files: {job['output_dir']}")
+        print(f"      HTML files:  {job['assets_dir']}")
+    log("------------------------------------------------------")
 
 
 if __name__ == "__main__":
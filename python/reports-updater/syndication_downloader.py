@@ -1,83 +1,248 @@
+import json
 import os
+import re
 import requests
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from download_and_extract import download_and_extract_snomed
+from download_and_extract import download_and_extract_snomed, download_snomed
+from file_locator import ZipRelease
+from release_pipeline import stream_release
+from rf2_cache import DEFAULT_CACHE_DIR
 from ci_utils import is_ci, log
 
+FEED_URL = "https://mlds.ihtsdotools.org/api/feed"
+# Module id of the International Edition, as in its contentItemVersion
+INTERNATIONAL_EDITION = "900000000000207008"
+# Entries of the editions read from the last full feed response, with its
+# ETag / Last-Modified (see load_feed); kept with the parsed RF2 tables
+FEED_CACHE_PATH = os.getenv(
+    "SNOMED_FEED_CACHE",
+    os.path.join(DEFAULT_CACHE_DIR, "syndication-feed.json")
+)
+FEED_TIMEOUT = (30, 120)
+FEED_CHUNK_SIZE = 64 * 1024
+
 ATOM_NS = {"atom": "http://www.w3.org/2005/Atom"}
 NCTS_NS = {"ncts": "http://ns.electronichealth.net.au/ncts/syndication/asf/extensions/1.0.0"}
 SCT_NS = {"sct": "http://snomed.info/syndication/sct-extension/1.0.0"}
+ENTRY_TAG = f"{{{ATOM_NS['atom']}}}entry"
 
 # Acceptable package types (similar to Java client)
 ACCEPTABLE_PACKAGE_TYPES = {"SCT_RF2_SNAPSHOT", "SCT_RF2_FULL", "SCT_RF2_ALL"}
 
-def get_latest_international_release(feed_url="https://mlds.ihtsdotools.org/api/feed"):
+def parse_content_version_date(content_version: str) -> str:
     """
-    Parse the SNOMED syndication Atom feed and find the latest
-    'SNOMED CT International Edition' entry with a ZIP link.
-    Filters by acceptable package types (RF2 ALL/FULL/SNAPSHOT).
-    
+    Extracts the YYYYMMDD release date from a feed contentItemVersion such as
+    'http://snomed.info/sct/900000000000207008/version/20251101'.
+    Returns None if the version does not carry a date.
+    """
+    match = re.search(r'/version/(\d{8})', content_version or "")
+    return match.group(1) if match else None
+
+
+def parse_content_version_edition(content_version: str) -> str:
+    """
+    Extracts the edition module id (e.g. '900000000000207008' for the
+    International Edition) from a feed contentItemVersion or
+    contentItemIdentifier such as 'http://snomed.info/sct/900000000000207008/version/20251101'.
+    Returns None if there is none.
+    """
+    match = re.search(r'/sct/(\d+)', content_version or "")
+    return match.group(1) if match else None
+
+
+def load_feed(feed_url=FEED_URL, cache_path=FEED_CACHE_PATH, editions=(INTERNATIONAL_EDITION,)):
+    """
+    Entries of the given editions (module ids, by default the International
+    Edition) in the syndication feed, for get_latest_edition_entry, at the
+    cost of one conditional request.
+
+    The entries of the last full response are kept in cache_path with the
+    response's ETag / Last-Modified, which are sent as If-None-Match /
+    If-Modified-Since. On 304 Not Modified the cached entries are returned;
+    otherwise the feed is parsed while it downloads (iter_edition_entries)
+    and the cache rewritten. A cache of other editions is not used.
+
+    Returns (entries, modified); modified is False when the entries come from
+    the cache because the feed did not change since.
+    """
+    editions = sorted(set(editions))
+    cache = _load_feed_cache(cache_path, feed_url, editions)
+    headers = {}
+    if cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    if cache.get("last_modified"):
+        headers["If-Modified-Since"] = cache["last_modified"]
+
+    with requests.get(feed_url, headers=headers, stream=True, timeout=FEED_TIMEOUT) as response:
+        if response.status_code == 304 and headers:
+            log("Syndication feed not modified since the last run; using the cached entries")
+            return cache["entries"], False
+        response.raise_for_status()
+        entries = list(iter_edition_entries(response.iter_content(chunk_size=FEED_CHUNK_SIZE), editions))
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+    if etag or last_modified:
+        _save_feed_cache(cache_path, {
+            "feed_url": feed_url,
+            "editions": editions,
+            "etag": etag,
+            "last_modified": last_modified,
+            "entries": entries,
+        })
+    return entries, True
+
+
+def _load_feed_cache(path, feed_url, editions):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if cache.get("feed_url") != feed_url or cache.get("editions") != editions or "entries" not in cache:
+        return {}
+    return cache
+
+
+def _save_feed_cache(path, cache):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def iter_edition_entries(chunks, editions=(INTERNATIONAL_EDITION,)):
+    """
+    Parses the Atom feed incrementally from chunks (an iterable of bytes) and
+    yields the entries of the given editions (module ids) with an acceptable
+    package type and a ZIP link, as dicts (see get_latest_edition_entry).
+
+    Every entry element is dropped from the tree once read, so only one entry
+    is held in memory however many editions the feed lists.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    feed = None
+
+    def entries():
+        nonlocal feed
+        for event, element in parser.read_events():
+            if event == "start":
+                if feed is None:
+                    feed = element
+            elif element.tag == ENTRY_TAG:
+                entry = _parse_entry(element, editions)
+                feed.remove(element)
+                if entry:
+                    yield entry
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from entries()
+    parser.close()
+    yield from entries()
+
+
+def _parse_entry(entry, editions):
+    """Dict of a feed entry of one of editions (module ids), or None for any other entry."""
+    # Get contentItemVersion, for the edition and for sorting
+    content_version_el = entry.find("ncts:contentItemVersion", NCTS_NS)
+    content_version = content_version_el.text if content_version_el is not None else ""
+
+    # Filter for the requested editions only
+    identifier_el = entry.find("ncts:contentItemIdentifier", NCTS_NS)
+    edition = parse_content_version_edition(content_version) or parse_content_version_edition(
+        identifier_el.text if identifier_el is not None else ""
+    )
+    if edition not in editions:
+        return None
+
+    title_el = entry.find("atom:title", ATOM_NS)
+    title = title_el.text if title_el is not None else ""
+
+    # Check category term (similar to Java client)
+    category = entry.find("atom:category", ATOM_NS)
+    if category is not None:
+        category_term = category.attrib.get("term", "")
+        if category_term not in ACCEPTABLE_PACKAGE_TYPES:
+            return None
+    else:
+        return None
+
+    # Get dates
+    updated_el = entry.find("atom:updated", ATOM_NS)
+    updated = updated_el.text if updated_el is not None else None
+
+    published_el = entry.find("atom:published", ATOM_NS)
+    published = published_el.text if published_el is not None else None
+
+    # International Edition version an extension is based on
+    dependency_el = entry.find("sct:packageDependency/sct:editionDependency", SCT_NS)
+    dependency = dependency_el.text.strip() if dependency_el is not None and dependency_el.text else None
+
+    # Get the ZIP link, with its size and checksum when the feed has them
+    zip_link = None
+    zip_size = None
+    zip_sha256 = None
+    for link in entry.findall("atom:link", ATOM_NS):
+        if link.attrib.get("type") == "application/zip":
+            zip_link = link.attrib.get("href")
+            length = link.attrib.get("length")
+            zip_size = int(length) if length and length.isdigit() else None
+            zip_sha256 = link.attrib.get(f"{{{NCTS_NS['ncts']}}}sha256Hash")
+            break
+
+    if not (zip_link and updated):
+        return None
+    return {
+        "title": title,
+        "updated": updated,
+        "published": published,
+        "content_version": content_version,
+        "release_date": parse_content_version_date(content_version),
+        "edition": edition,
+        "dependency": dependency,
+        "category": category_term,
+        "zip_url": zip_link,
+        "zip_size": zip_size,
+        "zip_sha256": zip_sha256
+    }
+
+
+def get_latest_international_entry(feed_url=FEED_URL, entries=None):
+    """
+    Find the latest 'SNOMED CT International Edition' entry with a ZIP link in
+    the SNOMED syndication Atom feed, read with load_feed (one conditional
+    request, cached). Filters by acceptable package types (RF2 ALL/FULL/SNAPSHOT).
+    Returns the entry as a dict, see get_latest_edition_entry.
+
+    Entries already read with load_feed can be passed as entries.
+
     Note: The feed itself is public and doesn't require authentication.
     Authentication is only needed when downloading the actual ZIP files.
     """
-    log("Fetching syndication feed (public access)...")
-    
-    # The feed is public, no authentication needed
-    response = requests.get(feed_url)
-    response.raise_for_status()
-
-    tree = ET.fromstring(response.content)
-    entries = []
-
-    for entry in tree.findall("atom:entry", ATOM_NS):
-        title_el = entry.find("atom:title", ATOM_NS)
-        title = title_el.text if title_el is not None else ""
-        
-        # Filter for International Edition only
-        if "SNOMED CT International Edition" not in title:
-            continue
-
-        # Check category term (similar to Java client)
-        category = entry.find("atom:category", ATOM_NS)
-        if category is not None:
-            category_term = category.attrib.get("term", "")
-            if category_term not in ACCEPTABLE_PACKAGE_TYPES:
-                continue
-        else:
-            continue
-
-        # Get dates
-        updated_el = entry.find("atom:updated", ATOM_NS)
-        updated = updated_el.text if updated_el is not None else None
-        
-        published_el = entry.find("atom:published", ATOM_NS)
-        published = published_el.text if published_el is not None else None
-
-        # Get contentItemVersion for sorting
-        content_version_el = entry.find("ncts:contentItemVersion", NCTS_NS)
-        content_version = content_version_el.text if content_version_el is not None else ""
-
-        # Get the ZIP link
-        zip_link = None
-        for link in entry.findall("atom:link", ATOM_NS):
-            if link.attrib.get("type") == "application/zip":
-                zip_link = link.attrib.get("href")
-                break
-
-        if zip_link and updated:
-            entries.append({
-                "title": title,
-                "updated": updated,
-                "published": published,
-                "content_version": content_version,
-                "category": category_term,
-                "zip_url": zip_link
-            })
+    if entries is None:
+        log("Fetching syndication feed (public access)...")
+        # The feed is public, no authentication needed
+        entries = load_feed(feed_url)[0]
+    return get_latest_edition_entry(entries, INTERNATIONAL_EDITION)
 
+
+def get_latest_edition_entry(entries, edition):
+    """
+    Latest entry of an edition (module id) among feed entries read with
+    load_feed, as a dict: title, updated, published, content_version,
+    release_date, edition, dependency (contentItemVersion of the International
+    Edition an extension is based on, or None), category, zip_url, zip_size,
+    zip_sha256. zip_size and zip_sha256 come from the length and
+    ncts:sha256Hash attributes of the ZIP link, and are None if the feed does
+    not provide them.
+    """
+    entries = [entry for entry in entries if entry["edition"] == edition]
     if not entries:
         raise RuntimeError(
-            "No International Edition found in the syndication feed with acceptable package types. "
+            f"No release of edition {edition} found in the syndication feed with acceptable package types. "
             "Check your MLDS credentials and access permissions."
         )
 
@@ -88,10 +253,9 @@ def get_latest_international_release(feed_url="https://mlds.ihtsdotools.org/api/
             return entry["content_version"]
         return entry["updated"]
     
-    entries.sort(key=sort_key, reverse=True)
-    latest = entries[0]
+    latest = dict(max(entries, key=sort_key))
 
-    log(f"✓ Latest International Edition: {latest['title']}")
+    log(f"✓ Latest release: {latest['title']}")
     log(f"  Published: {latest.get('published', 'N/A')}")
     log(f"  Version: {latest['content_version']}")
     log(f"  Package Type: {latest['category']}")
@@ -102,13 +266,29 @@ def get_latest_international_release(feed_url="https://mlds.ihtsdotools.org/api/
     log(f"  Download filename: {url_filename}")
     log(f"  Download URL: {zip_url[:80]}...")
     
-    return zip_url, latest["title"]
+    return latest
+
 
+def get_edition_entry(entries, content_version):
+    """Feed entry with the given contentItemVersion, e.g. the dependency of an extension, or None."""
+    for entry in entries:
+        if entry["content_version"] == content_version:
+            return dict(entry)
+    return None
 
-def download_latest_international(download_dir="data"):
+
+def get_latest_international_release(feed_url=FEED_URL):
     """
-    Downloads and extracts the latest International Edition release.
-    Requires SNOMED_USER and SNOMED_PASSWORD for downloading the ZIP file.
+    Returns (zip_url, title) of the latest International Edition in the feed.
+    """
+    latest = get_latest_international_entry(feed_url)
+    return latest["zip_url"], latest["title"]
+
+
+def _prepare_download(release):
+    """
+    Checks the MLDS credentials and resolves the release to download. Returns
+    the feed entry and the size/checksum to verify the ZIP against.
     """
     # Validate credentials before attempting download
     user = os.getenv("SNOMED_USER")
@@ -124,12 +304,47 @@ def download_latest_international(download_dir="data"):
     log(f"📋 Credentials found for: {user}")
     log("")
     
-    zip_url, title = get_latest_international_release()
+    if release is None:
+        release = get_latest_international_entry()
     log("")
-    log(f"📥 Downloading SNOMED International Edition: {title}")
-    root_folder = download_and_extract_snomed(zip_url, output_dir=download_dir)
+    log(f"📥 Downloading SNOMED release: {release['title']}")
+    # Size and checksum from the feed, verified after the download if present
+    expected = {
+        "expected_size": release.get("zip_size"),
+        "expected_sha256": release.get("zip_sha256"),
+    }
+    return release, expected
+
+
+def download_latest_international(download_dir="data", release=None, extract=True, tables=None):
+    """
+    Downloads and extracts the latest International Edition release.
+    Requires SNOMED_USER and SNOMED_PASSWORD for downloading the ZIP file.
+    An entry already resolved with get_latest_international_entry can be passed
+    as release to avoid reading the feed twice.
+
+    Returns the extracted release folder, or with extract=False a
+    file_locator.ZipRelease over the downloaded ZIP (nothing is extracted).
+    tables, a list of (file_type, release_type) pairs as in run-reports.py
+    REQUIRED_TABLES, extracts only those RF2 files instead of the whole release.
+    """
+    release, expected = _prepare_download(release)
+    if not extract:
+        return ZipRelease(download_snomed(release["zip_url"], output_dir=download_dir, **expected))
+    root_folder = download_and_extract_snomed(release["zip_url"], output_dir=download_dir, tables=tables, **expected)
     return root_folder
 
 
+def stream_latest_international(select, process, download_dir="data", release=None):
+    """
+    Downloads the latest International Edition release (or the given feed
+    entry, of any edition) and processes the members chosen by select while the ZIP is still
+    downloading, see release_pipeline.stream_release. Returns {key: result}.
+    Requires SNOMED_USER and SNOMED_PASSWORD, like download_latest_international.
+    """
+    release, expected = _prepare_download(release)
+    return stream_release(release["zip_url"], download_dir, select, process, **expected)
+
+
 if __name__ == "__main__":
     download_latest_international()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Test script for the resumable release download (download_and_extract.download_snomed),
+against a local HTTP server that stands in for MLDS (no credentials or internet needed):
+1. Connection dropped several times mid-download -> resumed with Range requests
+2. Server without Range support -> download restarted from the start
+3. .part file left by an earlier run -> only the missing bytes are downloaded
+4. Size / SHA-256 different from the feed -> error, no ZIP left behind
+5. Parallel download (several connections) with dropped connections -> ranges resumed
+6. Parallel download from a server without Range support -> single stream
+7. Complete .part file left by an earlier run -> not downloaded again
+8. One range fails for good -> the other connections stop without waiting out their backoff
+"""
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+
+os.environ.setdefault("SNOMED_USER", "test")
+os.environ.setdefault("SNOMED_PASSWORD", "test")
+
+import download_and_extract
+import requests
+from download_and_extract import download_snomed
+
+PAYLOAD = os.urandom(5 * 1024 * 1024 + 123)
+PAYLOAD_SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class ReleaseHandler(BaseHTTPRequestHandler):
+    """
+    Serves PAYLOAD; drops the connection after drop_after bytes for the first
+    failures requests, and answers 404 to ranges starting at missing_from or later.
+    """
+    supports_range = True
+    missing_from = None
+    failures = 0
+    drop_after = 1024 * 1024
+    requests_seen = []
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        ReleaseHandler.requests_seen.append(range_header)
+
+        start, end = 0, len(PAYLOAD)
+        if range_header and self.supports_range:
+            first, last = range_header.split("=")[1].split("-")
+            start = int(first)
+            if self.missing_from is not None and start >= self.missing_from:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if last:
+                end = min(int(last) + 1, len(PAYLOAD))
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:end]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if ReleaseHandler.failures > 0 and len(body) > self.drop_after:
+            ReleaseHandler.failures -= 1
+            self.wfile.write(body[:self.drop_after])
+            self.close_connection = True
+            return
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client only wanted the headers (e.g. a Range probe answered with 200)
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(supports_range=True, failures=0):
+    ReleaseHandler.supports_range = supports_range
+    ReleaseHandler.failures = failures
+    ReleaseHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReleaseHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/release.zip"
+
+
+def check_file(zip_path):
+    with open(zip_path, "rb") as f:
+        assert f.read() == PAYLOAD, "downloaded file differs from the served file"
+
+
+def test_resume_after_dropped_connections():
+    print("🔌 Step 1: Connection dropped 3 times mid-download...")
+    server, url = serve(failures=3)
+    with TemporaryDirectory() as output_dir:
+        zip_path = download_snomed(url, output_dir, len(PAYLOAD), PAYLOAD_SHA256, chunk_size_mb=0.25)
+        check_file(zip_path)
+    server.shutdown()
+    ranges = ReleaseHandler.requests_seen
+    assert len(ranges) == 4 and ranges[0] is None and all(ranges[1:]), ranges
+    print(f"   ✅ Completed in {len(ranges)} requests, resumed with {', '.join(ranges[1:])}")
+
+
+def test_restart_without_range_support():
+    print("🔁 Step 2: Server without Range support, connection dropped once...")
+    server, url = serve(supports_range=False, failures=1)
+    with TemporaryDirectory() as output_dir:
+        zip_path = download_snomed(url, output_dir, len(PAYLOAD), PAYLOAD_SHA256)
+        check_file(zip_path)
+    server.shutdown()
+    print(f"   ✅ Completed in {len(ReleaseHandler.requests_seen)} requests (restarted from the start)")
+
+
+def test_resume_leftover_part_file():
+    print("📂 Step 3: .part file left by an earlier run...")
+    server, url = serve()
+    with TemporaryDirectory() as output_dir:
+        with open(os.path.join(output_dir, "snomed_release.zip.part"), "wb") as f:
+            f.write(PAYLOAD[:3 * 1024 * 1024])
+        zip_path = download_snomed(url, output_dir, len(PAYLOAD), PAYLOAD_SHA256)
+        check_file(zip_path)
+    server.shutdown()
+    assert ReleaseHandler.requests_seen == [f"bytes={3 * 1024 * 1024}-"], ReleaseHandler.requests_seen
+    print(f"   ✅ Resumed with {ReleaseHandler.requests_seen[0]}")
+
+
+def test_verification_failures():
+    print("🔐 Step 4: Size and SHA-256 different from the feed...")
+    for expected in ({"expected_size": len(PAYLOAD) + 1}, {"expected_sha256": "0" * 64}):
+        server, url = serve()
+        with TemporaryDirectory() as output_dir:
+            try:
+                download_snomed(url, output_dir, **expected)
+            except RuntimeError as e:
+                assert not os.listdir(output_dir), os.listdir(output_dir)
+                print(f"   ✅ Rejected: {e}")
+            else:
+                raise AssertionError(f"download with {expected} was not rejected")
+        server.shutdown()
+
+
+def test_parallel_download_with_dropped_connections():
+    print("🔀 Step 5: Parallel download over 4 connections, connection dropped 3 times...")
+    ReleaseHandler.drop_after = 64 * 1024
+    server, url = serve(failures=3)
+    with TemporaryDirectory() as output_dir:
+        zip_path = download_snomed(url, output_dir, len(PAYLOAD), PAYLOAD_SHA256,
+                                   chunk_size_mb=0.25, connections=4)
+        check_file(zip_path)
+    server.shutdown()
+    ReleaseHandler.drop_after = 1024 * 1024
+    ranges = ReleaseHandler.requests_seen
+    # Probe, 16 ranges of ~320 KB, and one retry per dropped connection
+    assert ranges[0] == "bytes=0-0" and len(ranges) == 1 + 16 + 3, ranges
+    print(f"   ✅ Completed in {len(ranges)} requests ({len(ranges) - 4} ranges + probe + 3 resumed)")
+
+
+def test_parallel_download_without_range_support():
+    print("🔁 Step 6: Parallel download from a server without Range support...")
+    server, url = serve(supports_range=False)
+    with TemporaryDirectory() as output_dir:
+        zip_path = download_snomed(url, output_dir, len(PAYLOAD), PAYLOAD_SHA256, connections=4)
+        check_file(zip_path)
+    server.shutdown()
+    assert len(ReleaseHandler.requests_seen) == 2, ReleaseHandler.requests_seen
+    print("   ✅ Fell back to a single stream")
+
+
+def test_parallel_download_of_complete_part_file():
+    print("📂 Step 7: Complete .part file left by an earlier run, 4 connections...")
+    server, url = serve()
+    with TemporaryDirectory() as output_dir:
+        with open(os.path.join(output_dir, "snomed_release.zip.part"), "wb") as f:
+            f.write(PAYLOAD)
+        zip_path = download_snomed(url, output_dir, len(PAYLOAD), PAYLOAD_SHA256, connections=4)
+        check_file(zip_path)
+    server.shutdown()
+    assert ReleaseHandler.requests_seen == ["bytes=0-0"], ReleaseHandler.requests_seen
+    print("   ✅ Only the Range probe was requested")
+
+
+def test_parallel_download_cancelled_during_backoff():
+    print("🛑 Step 8: One range not found while another waits to retry...")
+    download_and_extract.RETRY_BACKOFF_SECONDS = 30
+    ReleaseHandler.drop_after = 64 * 1024
+    ReleaseHandler.missing_from = len(PAYLOAD) // 16
+    server, url = serve(failures=100)
+    started = time.perf_counter()
+    with TemporaryDirectory() as output_dir:
+        try:
+            download_snomed(url, output_dir, len(PAYLOAD), PAYLOAD_SHA256, chunk_size_mb=0.25, connections=4)
+        except requests.HTTPError as e:
+            elapsed = time.perf_counter() - started
+            assert elapsed < 10, f"took {elapsed:.1f}s"
+            assert os.listdir(output_dir) == ["snomed_release.zip.part"], os.listdir(output_dir)
+            print(f"   ✅ Failed after {elapsed:.1f}s: {e}")
+        else:
+            raise AssertionError("download with a missing range did not fail")
+    server.shutdown()
+    ReleaseHandler.missing_from = None
+    ReleaseHandler.drop_after = 1024 * 1024
+    download_and_extract.RETRY_BACKOFF_SECONDS = 0
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("🧪 Testing resumable release download (local server)")
+    print("=" * 70)
+    print()
+    # No need to wait between retries against a local server
+    download_and_extract.RETRY_BACKOFF_SECONDS = 0
+    test_resume_after_dropped_connections()
+    test_restart_without_range_support()
+    test_resume_leftover_part_file()
+    test_verification_failures()
+    test_parallel_download_with_dropped_connections()
+    test_parallel_download_without_range_support()
+    test_parallel_download_of_complete_part_file()
+    test_parallel_download_cancelled_during_backoff()
+    print()
+    print("=" * 70)
+    print("✅ SUCCESS - Resumable download tests passed!")
+    print("=" * 70)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming parse and the cache of the syndication feed
+(syndication_downloader.load_feed), against a local HTTP server that serves
+a generated feed with an ETag (no internet needed):
+1. First read -> only acceptable International Edition entries, cache written
+2. Feed unchanged -> one conditional request answered 304, cached entries used
+3. Feed changed -> parsed again, cache updated
+4. Other editions requested -> cache not used, their entries and dependencies read
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+
+from syndication_downloader import (
+    INTERNATIONAL_EDITION,
+    get_edition_entry,
+    get_latest_edition_entry,
+    get_latest_international_entry,
+    load_feed,
+)
+
+BASE_VERSION = "http://snomed.info/sct/900000000000207008/version/20240101"
+
+
+def feed_entry(title, term, version, sha256=None, dependency=None):
+    checksum = f' ncts:sha256Hash="{sha256}"' if sha256 else ""
+    if dependency:
+        dependency = f"""
+    <sct:packageDependency><sct:editionDependency>{dependency}</sct:editionDependency></sct:packageDependency>"""
+    return f"""
+  <entry>
+    <title>{title}</title>
+    <updated>2025-01-15T00:00:00Z</updated>
+    <published>2025-01-15T00:00:00Z</published>
+    <category term="{term}"/>
+    <ncts:contentItemVersion>{version}</ncts:contentItemVersion>{dependency or ""}
+    <link rel="alternate" type="application/zip" href="https://example.org/{term}/{version[-8:]}.zip" length="1234"{checksum}/>
+  </entry>"""
+
+
+def make_feed(latest_date):
+    entries = [
+        feed_entry("SNOMED CT International Edition", "SCT_RF2_ALL", BASE_VERSION),
+        feed_entry("SNOMED CT International Edition", "SCT_RF2_FULL",
+                   f"http://snomed.info/sct/900000000000207008/version/{latest_date}", "ab" * 32),
+        # Not an acceptable package type
+        feed_entry("SNOMED CT International Edition", "SCT_RF1",
+                   "http://snomed.info/sct/900000000000207008/version/20991231"),
+    ]
+    # Editions of other members, most of the feed
+    entries += [
+        feed_entry(f"SNOMED CT Member Edition {i}", "SCT_RF2_ALL", f"http://snomed.info/sct/{1000 + i}/version/20991231",
+                   dependency=BASE_VERSION)
+        for i in range(500)
+    ]
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom" '
+        'xmlns:ncts="http://ns.electronichealth.net.au/ncts/syndication/asf/extensions/1.0.0" '
+        'xmlns:sct="http://snomed.info/syndication/sct-extension/1.0.0">'
+        '<title>SNOMED CT Syndication Feed</title>'
+        + "".join(entries) +
+        "\n</feed>\n"
+    ).encode()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Serves feed with ETag etag, answering 304 to a matching If-None-Match."""
+    feed = b""
+    etag = '"1"'
+    statuses = []
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.etag:
+            FeedHandler.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        FeedHandler.statuses.append(200)
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.feed)))
+        self.end_headers()
+        self.wfile.write(self.feed)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_feed_checks(url, cache_path):
+    print("📡 Step 1: First read of the feed...")
+    FeedHandler.feed = make_feed("20250101")
+    entries, modified = load_feed(url, cache_path)
+    assert modified and FeedHandler.statuses == [200], FeedHandler.statuses
+    assert len(entries) == 2, entries
+    assert os.path.exists(cache_path)
+    latest = get_latest_international_entry(entries=entries)
+    assert latest["release_date"] == "20250101" and latest["zip_sha256"] == "ab" * 32, latest
+    print(f"   ✅ {len(entries)} International entries kept of {len(FeedHandler.feed) // 1024} KB of feed")
+
+    print("🗄  Step 2: Feed unchanged...")
+    cached, modified = load_feed(url, cache_path)
+    assert not modified and cached == entries, cached
+    assert FeedHandler.statuses == [200, 304], FeedHandler.statuses
+    print("   ✅ Answered 304 Not Modified, cached entries used")
+
+    print("🆕 Step 3: New release in the feed...")
+    FeedHandler.feed = make_feed("20250201")
+    FeedHandler.etag = '"2"'
+    entries, modified = load_feed(url, cache_path)
+    assert modified and FeedHandler.statuses == [200, 304, 200], FeedHandler.statuses
+    assert get_latest_international_entry(entries=entries)["release_date"] == "20250201"
+    assert load_feed(url, cache_path) == (entries, False)
+    print("   ✅ Feed parsed again and cache updated")
+
+    print("🌐 Step 4: A national edition besides the International Edition...")
+    entries, modified = load_feed(url, cache_path, editions=[INTERNATIONAL_EDITION, "1007"])
+    assert modified and FeedHandler.statuses == [200, 304, 200, 304, 200], FeedHandler.statuses
+    assert len(entries) == 3, entries
+    national = get_latest_edition_entry(entries, "1007")
+    assert national["title"] == "SNOMED CT Member Edition 7" and national["dependency"] == BASE_VERSION, national
+    assert get_edition_entry(entries, national["dependency"])["release_date"] == "20240101"
+    assert get_latest_international_entry(entries=entries)["dependency"] is None
+    print("   ✅ Cached International entries not reused, national entry read with its dependency")
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("🧪 Testing syndication feed parsing and cache (local server)")
+    print("=" * 70)
+    print()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with TemporaryDirectory() as cache_dir:
+        run_feed_checks(f"http://127.0.0.1:{server.server_port}/feed",
+                  os.path.join(cache_dir, "syndication-feed.json"))
+    server.shutdown()
+    print()
+    print("=" * 70)
+    print("✅ SUCCESS - Syndication feed tests passed!")
+    print("=" * 70)